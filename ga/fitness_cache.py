@@ -0,0 +1,148 @@
+'''
+Functionality for caching the results of strategies evaluated by the genetic
+algorithm, so that repeated strategies are not backtested again
+'''
+
+import os
+import json
+import hashlib
+import numpy as np
+
+# Project imports
+from utils import io
+
+# For type hinting
+from collections import OrderedDict
+
+def new_cache(size: int) -> dict:
+    '''
+    Create an empty cache
+
+    Parameters
+    ----------
+    size : int
+        The maximum number of entries to hold, the least recently used entries
+        are evicted beyond this
+
+    Returns
+    -------
+    cache : dict
+        The cache entries, along with the hit/miss counters
+    '''
+    return {'entries': OrderedDict(),
+            'size': size,
+            'hits': 0,
+            'misses': 0,
+            }
+
+def load_cache(size: int,
+               name: str = None) -> dict:
+    '''
+    Load a cache saved by save_cache, or create an empty one if there is no
+    saved cache (or no name is given)
+    '''
+    cache = new_cache(size)
+
+    if name is not None and os.path.isfile(name + '.pkl'):
+        cache['entries'].update(io.load_dict(name))
+        evict(cache)
+
+    return cache
+
+def save_cache(cache: dict,
+               name: str = None):
+    '''
+    Save the cache entries to a pickle file, if a name is given
+    '''
+    if name is not None:
+        io.save_dict(cache['entries'], name)
+
+    return
+
+def get_key(strat: dict,
+            strat_name: str,
+            tickers: list,
+            data_version: str) -> str:
+    '''
+    Get the cache key for a strategy evaluated on a set of tickers. The
+    parameters are converted to plain python types and sorted, so equal
+    strategies always give the same key.
+
+    Parameters
+    ----------
+    strat : dict
+        The strategy parameters
+    strat_name : str
+        The name of the strategy type, since the parameters of different
+        strategy types can be the same
+    tickers : list
+        The tickers the strategy is evaluated on
+    data_version : str
+        Identifies the price data the strategy is evaluated on (see
+        utils.panel.get_data_version), so results from before the price data
+        was updated are not reused
+
+    Returns
+    -------
+    key : str
+        The hash of the strategy, tickers and price data
+    '''
+    params = {k: canonical(v) for k, v in strat.items() if k != 'ticker opt'}
+
+    return hashlib.sha1(
+        json.dumps([strat_name, params, sorted(tickers), data_version],
+                   sort_keys = True).encode()
+        ).hexdigest()
+
+def canonical(value):
+    '''
+    Convert numpy scalars to their python equivalents
+    '''
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+def get(cache: dict,
+        key: str):
+    '''
+    Get an entry from the cache, returns None if it has not been cached
+    '''
+    if key in cache['entries']:
+        cache['hits'] += 1
+        cache['entries'].move_to_end(key)
+        return cache['entries'][key]
+
+    cache['misses'] += 1
+    return None
+
+def put(cache: dict,
+        key: str,
+        value):
+    '''
+    Add an entry to the cache, evicting the least recently used if full
+    '''
+    cache['entries'][key] = value
+    cache['entries'].move_to_end(key)
+    evict(cache)
+
+    return
+
+def evict(cache: dict):
+    '''
+    Evict the least recently used entries until the cache is within its size
+    '''
+    while len(cache['entries']) > cache['size']:
+        cache['entries'].popitem(last = False)
+
+    return
+
+def hit_rate(cache: dict) -> float:
+    '''
+    The percentage of lookups that were found in the cache
+    '''
+    lookups = cache['hits'] + cache['misses']
+    if lookups == 0:
+        return 0.
+    return 100*cache['hits']/lookups
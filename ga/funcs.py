@@ -4,16 +4,18 @@ Functionality for running the genetic algorithm
 
 import os
 import pickle
+import time
 import random
 import numpy as np
-import pandas as pd
 
 # User defined functions
 import strats as strat_lib
-from utils import tickers, strategy
+from ga import fitness_cache
+from utils import tickers, strategy, panel, indicators, warmup, workers
 
 # For type hinting
 from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor
 from numpy import array as np_arr
 from pandas import DataFrame as pandasDF
 
@@ -37,17 +39,29 @@ def main(ga_config: dict) -> dict:
     
     # This gathers the number of strategies to change on each evolution
     perc_change = int((1-ga_config['keep perc'])*ga_config['num strats'])
+    
+    # Start the worker processes if the fitness is to be calculated in parallel
+    pool = workers.get_pool(ga_config.get('workers', 1),
+                            setup_worker,
+                            data['tickers'],
+                            ga_config,
+                            )
+    
+    # Load the results of any previously evaluated strategies
+    cache = get_cache(ga_config)
 
     # Start the optimisation procedure
     for evl in range(0, ga_config['num evolutions']):
         
         # Calculate the fitness for the strategies
-        fit_arr = get_fitness(data,
-                              ga_config,
-                              strats,
-                              fit_arr,
-                              strats_to_calc,
-                              )
+        fit_arr, timings = get_fitness(data,
+                                       ga_config,
+                                       strats,
+                                       fit_arr,
+                                       strats_to_calc,
+                                       pool,
+                                       cache,
+                                       )
         
         # Rank the strategies, and select the strategies to change
         ranks = fit_arr[fit_arr[:, 1].argsort()]
@@ -86,11 +100,20 @@ def main(ga_config: dict) -> dict:
                   ', ' + ga_config['fitness'] + ': ' + 
                   str(fit_arr[strat, 1])
                   )
+        print('Time slicing data: ' + f'{timings["slicing"]:.2f}s' +
+              ', time backtesting: ' + f'{timings["backtest"]:.2f}s')
+        print('Fitness cache hit rate: ' +
+              f'{fitness_cache.hit_rate(cache):.1f}%')
         print('----------------------------------------------')
         
+    if pool is not None:
+        pool.shutdown()
+        
+    fitness_cache.save_cache(cache, ga_config.get('cache file'))
+        
     # Print the final results and save to json
     best_strat = strats[str(good_strats[-1])]
-    best_strat['ticker opt'] = data['ticker'].unique().tolist()
+    best_strat['ticker opt'] = list(data['tickers'])
     print_and_save(best_strat,
                    ga_config)
         
@@ -107,12 +130,16 @@ def out_sample_test(strat: dict,
                                                         strat['ticker opt'],
                                                         )
     
+    # The in sample results will usually already be cached from the ga run
+    cache = get_cache(ga_config)
+    
     # In sample test
     print('\n----------------------------------------------')
     print('In sample testing results: ')
     ticker_test(strat['ticker opt'],
                 strat,
                 ga_config,
+                cache,
                 )
     print('----------------------------------------------')
     
@@ -122,19 +149,41 @@ def out_sample_test(strat: dict,
     ticker_test(out_sample_tickers,
                 strat,
                 ga_config,
+                cache,
                 )
     print('----------------------------------------------')
     
+    fitness_cache.save_cache(cache, ga_config.get('cache file'))
+    
     return
 
 def ticker_test(tickers: list,
                 strat: dict,
-                ga_config: dict):
+                ga_config: dict,
+                cache: dict = None):
     '''
     Given a set of tickers, run the buy/sell algorithm and produce average
     statistics for the set of tickers
     '''
     
+    data = get_price_data(tickers)
+    
+    # Use the cached statistics if this strategy has been run on these tickers
+    key = fitness_cache.get_key(strat,
+                                ga_config['strat'],
+                                tickers,
+                                data['version'],
+                                )
+    ticker_stats = None if cache is None else fitness_cache.get(cache, key)
+    
+    if ticker_stats is None:
+        ticker_stats, _ = get_strat_stats(data,
+                                          ga_config,
+                                          strat,
+                                          )
+        if cache is not None:
+            fitness_cache.put(cache, key, ticker_stats)
+    
     # Key performance metric storage lists
     win_rate = []
     avg_profit = []
@@ -143,9 +192,7 @@ def ticker_test(tickers: list,
     num_trades = []
     
     for ticker in tickers:
-        df = pd.read_csv(f'data/{ticker}.csv')
-        df = strategy.add_strat_cols(df, strat, ga_config['strat'])        
-        _, stats = strategy.run_strategy(df, strat, ga_config['strat'])
+        stats = ticker_stats[ticker]
         
         win_rate.append(stats['win rate'])
         avg_profit.append(stats['avg profit'])
@@ -179,7 +226,7 @@ def print_and_save(strat: dict,
         
     return
     
-def init_ga(ga_config: dict) -> Tuple[pandasDF, dict, np_arr, np_arr]:
+def init_ga(ga_config: dict) -> Tuple[dict, dict, np_arr, np_arr]:
     '''
     Initialise any parameters and data needed for the genetic algorithm
 
@@ -190,8 +237,8 @@ def init_ga(ga_config: dict) -> Tuple[pandasDF, dict, np_arr, np_arr]:
 
     Returns
     -------
-    data : pandasDF
-        Price data for all tickers we are optimising
+    data : dict
+        Price data for all tickers we are optimising, see get_price_data
     strats : dict
         A random set of strategies
     fit_arr : np_arr
@@ -203,7 +250,20 @@ def init_ga(ga_config: dict) -> Tuple[pandasDF, dict, np_arr, np_arr]:
     # Check if the filing structure is correct
     check_folder()
     
-    # Get a random set of tickers, and load in the data we will optimise
+    # Seed the random number generators so that a run can be reproduced
+    if ga_config.get('seed') is not None:
+        random.seed(ga_config['seed'])
+        np.random.seed(ga_config['seed'])
+    
+    # Limit the memory used for caching the moving averages/std devs
+    set_indicator_cache(ga_config)
+    
+    # Compile the backtesting kernels (or load them from the disk cache) before
+    # timing any evolutions
+    warmup.compile_kernels()
+    
+    # Get a random set of tickers, and load in the data we will optimise. The
+    # ticker -> block index is built here once and reused in every evolution
     ticker_list = tickers.get_random_tickers(ga_config['num tickers'])
     data = get_price_data(ticker_list)
     
@@ -224,11 +284,13 @@ def init_ga(ga_config: dict) -> Tuple[pandasDF, dict, np_arr, np_arr]:
     
     return data, strats, fit_arr, strats_to_calc
     
-def get_fitness(data: pandasDF,
+def get_fitness(data: dict,
                 ga_config: dict,
                 strats: dict,
                 fit_arr: np_arr,
-                strats_to_calc: np_arr) -> np_arr:
+                strats_to_calc: np_arr,
+                pool: ProcessPoolExecutor = None,
+                cache: dict = None) -> Tuple[np_arr, dict]:
     '''
     Calculate the fitness function for each strategy defined in strats_to_calc.
     This runs the buy/sell algorithm on each ticker, and then uses the mean
@@ -236,7 +298,7 @@ def get_fitness(data: pandasDF,
 
     Parameters
     ----------
-    data : pandasDF
+    data : dict
         Price data for all tickers we are optimising
     ga_config : dict
         Config controls for the genetic algo
@@ -246,68 +308,299 @@ def get_fitness(data: pandasDF,
         An array to store the fitness results for each strategy
     strats_to_calc : np_arr
         Which strategies to calculate the fitness value for
+    pool : ProcessPoolExecutor
+        The worker processes to calculate the fitness with, if None the
+        fitness is calculated in this process
+    cache : dict
+        The results of previously evaluated strategies (see ga.fitness_cache),
+        if None every strategy is evaluated
 
     Returns
     -------
     fit_arr : np_arr
         The recalculated fitness values for the new strategies
+    timings : dict
+        The time (in seconds) spent slicing the price data and backtesting,
+        summed over all worker processes
     '''
     
-    for strat in strats_to_calc:
+    keys = [fitness_cache.get_key(strats[str(strat)],
+                                  ga_config['strat'],
+                                  data['tickers'],
+                                  data['version'],
+                                  )
+            for strat in strats_to_calc]
+    
+    # Find the strategies which have not been evaluated before, any strategy
+    # repeated within this evolution is only evaluated once
+    results = {}
+    to_calc = {}
+    for strat, key in zip(strats_to_calc, keys):
+        ticker_stats = None if cache is None else fitness_cache.get(cache, key)
+        if ticker_stats is not None:
+            results[key] = ticker_stats
+        elif key not in to_calc:
+            to_calc[key] = strats[str(strat)]
+    
+    # The results are returned in the same order as the strategies were given,
+    # so the outcome does not depend on the number of workers
+    if ga_config.get('batch backtest', False):
+        calculated = get_population_stats(data, ga_config, list(to_calc.values()), pool)
+    elif pool is None:
+        calculated = [get_strat_stats(data, ga_config, strat)
+                      for strat in to_calc.values()]
+    else:
+        calculated = list(pool.map(worker_stats, to_calc.values()))
+    
+    timings = {'slicing': 0., 'backtest': 0.}
+    
+    for key, (ticker_stats, strat_timings) in zip(to_calc.keys(), calculated):
+        results[key] = ticker_stats
+        if cache is not None:
+            fitness_cache.put(cache, key, ticker_stats)
         
-        # Initialise a list to store the result of this strategy
-        res = []
+        timings['slicing'] += strat_timings['slicing']
+        timings['backtest'] += strat_timings['backtest']
+    
+    for strat, key in zip(strats_to_calc, keys):
+        fit_arr[strat, 1] = get_fitness_value(results[key],
+                                              data['tickers'],
+                                              ga_config,
+                                              )
         
-        for ticker in data['ticker'].unique():
-            
-            # Add the strategy columns to the dataframe
-            df_strat = data[data['ticker'] == ticker].reset_index().drop(columns = ['index'])
-            df_strat = strategy.add_strat_cols(df_strat,
-                                               strats[str(strat)],
-                                               ga_config['strat'],
-                                               )
-            
-            # Run the buy/sell algorithm and produce the statistics
-            _, stats = strategy.run_strategy(df_strat,
-                                             strats[str(strat)],
-                                             ga_config['strat'],
-                                             )
-            
-            # We want to strongly encourage the algorithm to not take any strat
-            # which performes trades less than min_trades, this prevents some
-            # curve fitting to very rare events
-            if stats['number of trades'] > ga_config['min trades']:
-                res.append(stats[ga_config['fitness']])
-            else:
-                res.append(-100)
-            
-        # Find the average result for this strategy
-        fit_arr[strat, 1] = np.mean(res)
+    return fit_arr, timings
+
+def get_fitness_value(ticker_stats: dict,
+                      ticker_list: list,
+                      ga_config: dict) -> float:
+    '''
+    From the statistics of a strategy on each ticker, find the fitness value
+    '''
+    
+    # Initialise a list to store the result of this strategy
+    res = []
+    
+    for ticker in ticker_list:
+        stats = ticker_stats[ticker]
         
-    return fit_arr
+        # We want to strongly encourage the algorithm to not take any strat
+        # which performes trades less than min_trades, this prevents some
+        # curve fitting to very rare events
+        if stats['number of trades'] > ga_config['min trades']:
+            res.append(stats[ga_config['fitness']])
+        else:
+            res.append(-100)
         
-def get_price_data(tickers: list) -> pandasDF:
+    # Find the average result for this strategy
+    return np.mean(res)
+
+def get_strat_stats(data: dict,
+                    ga_config: dict,
+                    strat: dict) -> Tuple[dict, dict]:
     '''
-    Generate a dataframe which contains all the price data for each ticker
+    Run the buy/sell algorithm for a single strategy on each ticker
+
+    Parameters
+    ----------
+    data : dict
+        Price data for all tickers we are optimising
+    ga_config : dict
+        Config controls for the genetic algo
+    strat : dict
+        The strategy parameters
+
+    Returns
+    -------
+    ticker_stats : dict
+        The strategy statistics for each ticker
+    timings : dict
+        The time (in seconds) spent slicing the price data and backtesting
+    '''
+    
+    timings = {'slicing': 0., 'backtest': 0.}
+    ticker_stats = {}
+    
+    for ticker in data['tickers']:
+        
+        # Take this ticker's contiguous block of the price data
+        start = time.perf_counter()
+        df_strat = get_ticker_df(data, ticker)
+        timings['slicing'] += time.perf_counter() - start
+        
+        # Add the strategy columns to the dataframe
+        start = time.perf_counter()
+        df_strat = strategy.add_strat_cols(df_strat,
+                                           strat,
+                                           ga_config['strat'],
+                                           )
+        
+        # Run the buy/sell algorithm and produce the statistics
+        _, ticker_stats[ticker] = strategy.run_strategy(df_strat,
+                                                        strat,
+                                                        ga_config['strat'],
+                                                        stats_only = True,
+                                                        )
+        timings['backtest'] += time.perf_counter() - start
+        
+    return ticker_stats, timings
+
+def set_indicator_cache(ga_config: dict):
+    '''
+    Set the memory limit for the cached strategy indicators, so that each
+    moving average/std dev is only calculated once per ticker
+    '''
+    indicators.set_cache_size(ga_config.get('indicator cache mb', 512)*1024**2)
+
+def get_population_stats(data: dict,
+                         ga_config: dict,
+                         strat_list: list,
+                         pool: ProcessPoolExecutor = None) -> list:
+    '''
+    Run the buy/sell algorithm for a population of strategies, with a single
+    batched backtest per ticker. With a pool, each worker runs the batch for
+    a contiguous chunk of the strategies.
+
+    Returns
+    -------
+    results : list
+        The (ticker_stats, timings) of each strategy, as from get_strat_stats
+    '''
+    if pool is None:
+        return get_batch_stats(data, ga_config, strat_list)
+    
+    chunk = -(-len(strat_list)//ga_config['workers'])
+    chunks = [strat_list[n:n + chunk] for n in range(0, len(strat_list), chunk)]
+    
+    return [res for results in pool.map(worker_batch_stats, chunks)
+            for res in results]
+
+def get_batch_stats(data: dict,
+                    ga_config: dict,
+                    strat_list: list) -> list:
+    '''
+    Run the buy/sell algorithm for a list of strategies on each ticker, with
+    every strategy backtested in one compiled call per ticker.
+
+    Parameters
+    ----------
+    data : dict
+        Price data for all tickers we are optimising
+    ga_config : dict
+        Config controls for the genetic algo
+    strat_list : list
+        The parameters of each strategy
+
+    Returns
+    -------
+    results : list
+        The (ticker_stats, timings) of each strategy, as from get_strat_stats.
+        The timings of the batch are split evenly between the strategies.
+    '''
+    
+    timings = {'slicing': 0., 'backtest': 0.}
+    ticker_stats = [{} for strat in strat_list]
+    
+    if len(strat_list) == 0:
+        return []
+    
+    for ticker in data['tickers']:
+        
+        # Take this ticker's contiguous block of the price data
+        start = time.perf_counter()
+        df = get_ticker_df(data, ticker)
+        timings['slicing'] += time.perf_counter() - start
+        
+        # Find the signals of each strategy and backtest them together
+        start = time.perf_counter()
+        batch_stats = strategy.run_strategy_batch(df,
+                                                  strat_list,
+                                                  ga_config['strat'],
+                                                  )
+        timings['backtest'] += time.perf_counter() - start
+        
+        for n, stats in enumerate(batch_stats):
+            ticker_stats[n][ticker] = stats
+            
+    timings = {k: v/len(strat_list) for k, v in timings.items()}
+    
+    return [(stats, timings) for stats in ticker_stats]
+
+def get_cache(ga_config: dict) -> dict:
+    '''
+    Load the cache of evaluated strategies, from the cache file if configured
+    '''
+    return fitness_cache.load_cache(ga_config.get('cache size', 10000),
+                                    ga_config.get('cache file'),
+                                    )
+
+def setup_worker(ticker_list: list,
+                 ga_config: dict) -> dict:
+    '''
+    Get the state of a worker process, the price data for the tickers and the
+    config. Each worker opens the memory-mapped price panel itself, so the
+    price data is shared through the page cache.
+    '''
+    set_indicator_cache(ga_config)
+    return {'data': get_price_data(ticker_list, rebuild = False),
+            'ga config': ga_config,
+            }
+    
+def worker_stats(strat: dict) -> Tuple[dict, dict]:
+    '''
+    Run the buy/sell algorithm for a strategy in a worker process
+    '''
+    return get_strat_stats(workers.state['data'], workers.state['ga config'], strat)
+
+def worker_batch_stats(strat_list: list) -> list:
+    '''
+    Run the batched buy/sell algorithm for strategies in a worker process
+    '''
+    return get_batch_stats(workers.state['data'], workers.state['ga config'], strat_list)
+        
+def get_price_data(tickers: list,
+                   rebuild: bool = True) -> dict:
+    '''
+    Get the price data for each ticker, as contiguous blocks of rows in the
+    memory-mapped price panel
 
     Parameters
     ----------
     tickers : list
         List of tickers to optimise the strategy for
+    rebuild : bool
+        Whether to rebuild the panel if it is out of date
 
     Returns
     -------
-    df : pandasDF
-        A dataframe of all price data for each ticker.
+    data : dict
+        build : the id of the panel build the data is from
+        version : identifies the price data, for the fitness cache
+        tickers : the tickers to optimise the strategy for
+        index : ticker -> (start, stop) rows of its block in the panel
+        fields, dates, values : the price panel arrays (see utils.panel)
     '''
     
-    dfs = []
-    for ticker in tickers:
-        df = pd.read_csv(f'data/{ticker}.csv')
-        df['ticker'] = ticker
-        dfs.append(df)
-        
-    return pd.concat(dfs)
+    # The memory-mapped panel is shared with any other runs on this machine.
+    # Any ticker missing from the panel is loaded from the price store instead
+    prices = panel.load_panel(rebuild)
+    
+    return {'build': prices['build'],
+            'version': panel.get_data_version(prices, tickers),
+            'tickers': list(tickers),
+            'index': {ticker: prices['index'][ticker] for ticker in tickers
+                      if ticker in prices['index']},
+            'fields': prices['fields'],
+            'dates': prices['dates'],
+            'values': prices['values'],
+            }
+
+def get_ticker_df(data: dict,
+                  ticker: str) -> pandasDF:
+    '''
+    Get the price data for a single ticker from its block in the price data.
+    The dates are left as integers since they are not needed for the fitness.
+    '''
+    return panel.get_ticker_df(data, ticker, str_dates = False)
 
 
 def breed_good_strats(good_strats: np_arr,
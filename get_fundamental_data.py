@@ -0,0 +1,39 @@
+'''
+Main function to download the fundamental statements from AlphaVantage
+'''
+from utils import fund_download
+
+if __name__ == "__main__":
+    
+    # Configuration settings for the downloader
+    download_config = {'api key': 'INSERT',
+                       'tickers': ['TROW', 'VIAC', 'ZION', 'INFO', 'TTWO',
+                                   'XLNX', 'ZTS', 'TMUS'],
+                       
+                       # Where the API is, this can be pointed at a local
+                       # stand-in (utils/single_scripts/fake_alpha_vantage.py)
+                       'base url': 'https://www.alphavantage.co/query',
+                       
+                       # The API quota, a free key allows 5 calls per minute
+                       # and 500 per day. 'burst' is how many calls can be
+                       # made at once before the per-minute rate applies.
+                       'calls per minute': 5,
+                       'calls per day': 500,
+                       'burst': 1,
+                       
+                       # The number of calls running at the same time
+                       'workers': 2,
+                       
+                       # A job is marked as failed after 'max attempts' errors,
+                       # and the run stops after the rate limit is hit 'max
+                       # limited' times in a row
+                       'max attempts': 3,
+                       'max limited': 3,
+                       'timeout': 30,
+                       
+                       # The file keeping track of the jobs, so an interrupted
+                       # download carries on where it left off
+                       'job file': 'data/fundamental_jobs.json',
+                       }
+    
+    fund_download.main(download_config)
@@ -17,6 +17,18 @@ if __name__ == "__main__":
                  
                  # The days back in time to include as features in the NN
                  'time lags': range(1, 41), # Which days back to include in the nn features
+                 
+                 # Gather the features directly at the rows each trade was made,
+                 # rather than merging the trades back onto the dates
+                 'trade anchored': True,
+                 
+                 # Number of processes to generate the data for the tickers
+                 # in parallel, and how often to print the progress
+                 'workers': 1,
+                 'progress every': 25,
+                 
+                 # Maximum number of trades in each file of the saved data
+                 'shard rows': 100000,
                  }
 
     # Generate the input for the NN
@@ -1,4 +1,4 @@
-from utils import tickers
+from utils import tickers, price_store, warmup
      
 if __name__ == "__main__":
     
@@ -7,8 +7,25 @@ if __name__ == "__main__":
     # 'spy' downloads all the current s&p 500 tickers
     download_type = 'spy'
     
+    # Whether to only download the days since the last download of each
+    # ticker, rather than the full history, and how many tickers to download
+    # at a time
+    incremental = True
+    batch_size = 100
+    
     # Check the above option is correct and set the file-paths
     tickers.check_run(download_type)
     
     # Grab the list of tickers and run the downloader
-    tickers.get_data(tickers.get_tickers(download_type))
\ No newline at end of file
+    tickers.get_data(tickers.get_tickers(download_type),
+                     incremental = incremental,
+                     batch_size = batch_size,
+                     )
+    
+    # Convert the downloaded csv files into the binary price store, so the
+    # conversion cost is not paid on the first run of the tools
+    price_store.convert_all()
+    
+    # Compile the numba kernels into the disk cache, so that later runs start
+    # straight away
+    warmup.compile_kernels(include_nn = True)
@@ -0,0 +1,128 @@
+'''
+Functionality for building the lagged time-series features for the nn.
+
+Each price/strategy column is viewed as a (row x window) array of its history
+with a sliding window, which does not copy the data. Only the rows that are
+fed into the nn are then gathered from the windows, so the lagged values are
+never calculated for the rest of the price history.
+'''
+
+import numpy as np
+
+# Other imports and type-hinting
+from numpy import array as np_arr
+from pandas import DataFrame as pandasDF
+from numpy.lib.stride_tricks import sliding_window_view
+
+# The (low, high) column pairs whose percentage difference is included as a
+# feature, i.e. the candle sizes
+CANDLE_FEATS = [('Close', 'Open'), ('Low', 'High')]
+
+def get_windows(x: np_arr,
+                rows: np_arr,
+                max_lag: int) -> np_arr:
+    '''
+    Get the history of x for each of the rows
+
+    Parameters
+    ----------
+    x : np_arr
+        The full time-series
+    rows : np_arr
+        The indexes of the rows to get the history for
+    max_lag : int
+        How many days back to include
+
+    Returns
+    -------
+    windows : np_arr
+        Array of shape (rows, max_lag + 1), where windows[n, max_lag - lag] is
+        x[rows[n] - lag]. Days before the start of x are nan.
+    '''
+    # Pad the start with nans so every row has a full window, which matches
+    # the missing values from shifting a series
+    x = np.concatenate((np.full(max_lag, np.nan), np.asarray(x, dtype = np.float64)))
+
+    return sliding_window_view(x, max_lag + 1)[rows]
+
+def get_lag_features(df: pandasDF,
+                     rows: np_arr,
+                     strat_config: dict,
+                     lags: list) -> pandasDF:
+    '''
+    Build the lagged time-series features for a set of rows of the price data
+
+    Parameters
+    ----------
+    df : pandasDF
+        The price data with the strategy columns included
+    rows : np_arr
+        The indexes of the rows in df to produce features for
+    strat_config : dict
+        The config params for the trading strategy, which give the columns to
+        include as returns ('return feats') or as they are ('time series
+        feats')
+    lags : list
+        A list of integers to denote the time series points
+
+    Returns
+    -------
+    feats : pandasDF
+        The lagged features for each row, with a column for each feature and
+        lag in the order: returns, time series feats, and then the candle sizes
+    '''
+    lags = np.asarray(list(lags), dtype = np.int64)
+    max_lag = int(lags.max())
+
+    # The position of each lag in the windows
+    lag_idx = max_lag - lags
+
+    names = []
+    blocks = []
+
+    # Time series of returns (i.e. log percentage changes)
+    for col in strat_config['return feats']:
+        windows = get_windows(df[col].values, rows, max_lag)
+        blocks.append(np.log(windows[:, lag_idx + 1]/windows[:, lag_idx]))
+        names += [f'{col}_t-{lag}' for lag in lags]
+
+    # Other time series features
+    for col in strat_config['time series feats']:
+        blocks.append(get_windows(df[col].values, rows, max_lag)[:, lag_idx])
+        names += [f'{col}_t-{lag}' for lag in lags]
+
+    # The percentage differences between the candle columns
+    for low, high in CANDLE_FEATS:
+        low_windows = get_windows(df[low].values, rows, max_lag)
+        high_windows = get_windows(df[high].values, rows, max_lag)
+        blocks.append(high_windows[:, lag_idx]/low_windows[:, lag_idx] - 1)
+        names += [f'{high}_{low}_t-{lag}' for lag in lags]
+
+    return pandasDF(np.hstack(blocks), columns = names)
+
+def to_rnn(x: np_arr,
+           n_lags: int) -> np_arr:
+    '''
+    Reshape a block of lagged features into a 3D array of the form (sample,
+    time series, feature). get_lag_features stores the lags of each feature
+    next to each other, so this is a view of x (reshape and transpose) rather
+    than a copy, and keeps the dtype of x.
+
+    Parameters
+    ----------
+    x : np_arr
+        The (sample, feature x lag) block of features
+    n_lags : int
+        The number of time-lags used
+
+    Returns
+    -------
+    x_rnn : np_arr
+        The (sample, lag, feature) view of x
+    '''
+    num_feats = x.shape[1]//n_lags
+
+    # Any trailing columns which are not a full set of lags are left out
+    x = x[:, :num_feats*n_lags]
+
+    return x.reshape(x.shape[0], num_feats, n_lags).transpose(0, 2, 1)
@@ -3,14 +3,17 @@ Functions for the neural network
 '''
 
 import os
+import time
 import numpy as np
 import numba as nb
 import pandas as pd
 
 # Project imports
-from utils import tickers, strategy, dates, fundamentals, io
+from nn import features, shards
+from utils import tickers, strategy, fund_store, io, price_store, panel, workers
 
 # Other imports and type-hinting
+from numpy import array as np_arr
 from pandas import DataFrame as pandasDF
 
 def main(nn_config: dict,
@@ -67,10 +70,12 @@ def main(nn_config: dict,
             1,
             )
                 
-        # Save the input data into the data-folder
-        df.to_csv('nn/data/' + nn_config['strat name'] + ' ' + case + '.csv',
-                  index = False,
-                  )
+        # Save the input data into the data-folder, as binary shards which
+        # can be memory-mapped when training/testing
+        shards.write_shards(df,
+                            shards.get_folder(nn_config['strat name'], case),
+                            nn_config.get('shard rows', 100000),
+                            )
     return     
 
 def get_nn_input(tickers: list,
@@ -122,26 +127,56 @@ def get_nn_input(tickers: list,
     # Drop any null entries, to stop any bad-data getting into the nn
     return df.dropna()
 
-def include_fundamentals(df: pandasDF):
-    
-    dfs = []
-    
-    for ticker in df['ticker'].unique():
-        
-        df_tmp = df[df['ticker'] == ticker]
-        try:
-            fund = fundamentals.get_all_fundamentals(ticker)
-            df_tmp = dates.backwards_date_merge(df_tmp,
-                                                fund,
-                                                'Date',
-                                                'fiscal_quarter',
-                                                'date')
-            dfs.append(df_tmp)
-        except Exception as e:
-            print(ticker, ' : ', e)
-            
-    return pd.concat(dfs)
-            
+def include_fundamentals(df: pandasDF) -> pandasDF:
+    '''
+    Attach the latest fundamentals (at the date of each trade) to every trade,
+    with a single as-of join over all tickers. Trades of tickers without
+    fundamentals, or from before the first statement of their ticker, are
+    dropped and reported.
+
+    Parameters
+    ----------
+    df : pandasDF
+        The trades of every ticker
+
+    Returns
+    -------
+    df : pandasDF
+        The trades with the fundamental features, grouped by ticker in the
+        same order as df and in date order within each ticker
+    '''
+    ticker_list = df['ticker'].unique().tolist()
+    fund, failures = fund_store.load_fund_panel(ticker_list)
+
+    # The as-of join needs both sides sorted by date, using the integer dates
+    # rather than parsing the strings
+    df = df.assign(date = price_store.dates_to_int(df['Date'].values))
+    df = df.iloc[np.argsort(df['date'].values, kind = 'stable')]
+
+    df = pd.merge_asof(df,
+                       fund,
+                       on = 'date',
+                       by = 'ticker',
+                       direction = 'backward',
+                       )
+
+    # Trades before the first statement of their ticker have no fundamentals
+    missing = df['fiscal_quarter'].isna().values
+    counts = df.loc[missing, 'ticker'].value_counts()
+    for ticker, count in counts.items():
+        if ticker not in failures:
+            failures[ticker] = f'{count} trades before the first statement'
+
+    for ticker, reason in failures.items():
+        print(f'No fundamentals for {ticker}: {reason}')
+
+    df = df[~missing]
+
+    # Put the trades back in ticker order
+    codes = pd.Categorical(df['ticker'], categories = ticker_list).codes
+    df = df.iloc[np.lexsort((df['date'].values, codes))]
+
+    return df.drop(columns = 'date').reset_index(drop = True)
 
 def single_stock_data(ticker: str,
                       nn_config: dict) -> pandasDF:
@@ -162,7 +197,7 @@ def single_stock_data(ticker: str,
         The time series data for a single ticker.
     '''
     
-    df = pd.read_csv(f'data/{ticker}.csv')
+    df = price_store.load_price_df(ticker)
 
     # Add the time-series columns, and then normalise them
     for col in ['Open', 'Low', 'High', 'Close', 'Volume']:
@@ -174,29 +209,33 @@ def single_stock_data(ticker: str,
                    )
     
 def normalise_prices(df: pandasDF,
-                     price_cols: list):
+                     price_cols: list,
+                     float32: bool = False) -> pandasDF:
     '''
-    Normalise all price related time-series on the same scale.
+    Normalise all price related time-series on the same scale. See
+    normalise_time_series for the float32 option.
     '''
     # Find all columns which are price related
     cols = []
     for feat in price_cols:
         cols += get_lagged_col_names(df, feat)
         
-    # Normalise these cols agaisnt the max value in each row
-    return normalise_time_series(df, cols)
+    # Normalise these cols against the values in each row
+    return normalise_time_series(df, cols, float32)
         
 def normalise_non_price(df: pandasDF,
-                        other_feats: list):
+                        other_feats: list,
+                        float32: bool = False) -> pandasDF:
     '''
-    For each non-price related time-series, normalise them
+    For each non-price related time-series, normalise them. See
+    normalise_time_series for the float32 option.
     '''
     for feat in other_feats:
         cols = get_lagged_col_names(df, feat)
-        df = normalise_time_series(df, cols)
+        df = normalise_time_series(df, cols, float32)
         
     return df
-    
+
 def get_lagged_col_names(df: pandasDF,
                          feat: str) -> list:
     '''
@@ -205,13 +244,41 @@ def get_lagged_col_names(df: pandasDF,
     return [col for col in df.columns.tolist() if feat in col]
 
 def normalise_time_series(df: pandasDF,
-                          cols: list) -> pandasDF:
+                          cols: list,
+                          float32: bool = False) -> pandasDF:
     '''
-    For a set of columns normalise by using a standard scaling approach
+    For a set of columns normalise each row by using a standard scaling
+    approach, i.e. subtract the mean and divide by the (population) std dev of
+    the row. Missing values are ignored in the mean/std dev.
+    
+    Each row is scaled by its own statistics, so there is nothing to store
+    for inference - the same transform is applied by calling this on the new
+    rows.
+
+    Parameters
+    ----------
+    df : pandasDF
+        The nn input data
+    cols : list
+        The columns to normalise together
+    float32 : bool
+        Whether to store the normalised columns as float32, rather than float64
+
+    Returns
+    -------
+    df : pandasDF
+        The data with the columns normalised
     '''
-    df[cols] = df[cols].apply(lambda x: (x-x.mean())/x.std(ddof = 0),
-                              axis = 1,
-                              )
+    values = df[cols].to_numpy(dtype = np.float64)
+    
+    mean = np.nanmean(values, axis = 1)
+    std = np.nanstd(values, axis = 1)
+    
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        values = (values - mean[:, None])/std[:, None]
+    
+    df[cols] = values.astype(np.float32 if float32 else np.float64)
+    
     return df
 
 def get_time_series_data(nn_config: dict,
@@ -231,174 +298,222 @@ def get_time_series_data(nn_config: dict,
     ticker_list : list
         A list of tickers to run the buy/sell for, and produce input data for
         the nn
-    date_filter : str
-        The earliest date to consider across all stocks for training
 
     Returns
     -------
     dfs : list
         A dataframe containing all trades
     '''    
-    # Open an empty list to store the processed dataframes per each ticker
-    dfs = []
+    # Open the memory-mapped price panel shared between processes, building
+    # it first if needed so the workers only have to open it
+    prices = panel.load_panel()
+    pool = workers.get_pool(nn_config.get('workers', 1),
+                            setup_worker,
+                            nn_config,
+                            strat_config,
+                            )
 
     # For each ticker in the ticker list, run the buy/sell and pre-process
-    # the data for input into the nn
-    for ticker in ticker_list:
-        
-        df = pd.read_csv(f'data/{ticker}.csv')
-        df = strategy.add_strat_cols(df,
-                                     strat_config,
-                                     nn_config['strat name'],
-                                     )
-        
-        # Since we only have fundamental data since 2017, there is no point
-        # searching for training data beyond that
-        if nn_config['include fundamentals']:
-            df = df[df['Date'] >= '2017-01-01']
-        else:
-            df = df[df['Date'] >= nn_config['lower date filter']]
+    # the data for input into the nn. The results are returned in the order
+    # of the tickers, however many workers are used.
+    if pool is None:
+        results = (get_ticker_trades(prices, ticker, nn_config, strat_config)
+                   for ticker in ticker_list)
+    else:
+        results = pool.map(worker_trades,
+                           ticker_list,
+                           chunksize = nn_config.get('chunk size', 1),
+                           )
+    
+    dfs = []
+    num_rows = 0
+    start = time.perf_counter()
+    
+    for n, df in enumerate(results, 1):
+        if df is not None:
+            dfs.append(df)
+            num_rows += df.shape[0]
         
-        if len(df) > 0:
-            df_strat, _ = strategy.run_strategy(df,
-                                                strat_config,
-                                                nn_config['strat name'],
-                                                )
+        if n % nn_config.get('progress every', 25) == 0 or n == len(ticker_list):
+            print_progress(n,
+                           len(ticker_list),
+                           num_rows,
+                           time.perf_counter() - start,
+                           )
             
-            # If at least one trade has been made, create the nn features
-            if len(df_strat) > 0:
-                
-                # If the bollinger squeeze is wanted, then normalise the
-                # difference between the bands by dividing by 100
-                if nn_config['strat name'] == 'bollinger squeeze':
-                    df['boll_diff'] = df['boll_diff']/100
-                
-                # Obtain time series of returns (i.e. percentage changes)
-                for col in strat_config['return feats']:
-                    df = time_series_returns(df, col, nn_config['time lags'])
-                    
-                # Other time series features
-                for col in strat_config['time series feats']:
-                    df = time_series_feats(df, col, nn_config['time lags'])
-                
-                # Include the candle sizes as features
-                df = perc_diff_time_series(df, 'Close', 'Open', nn_config['time lags'])
-                df = perc_diff_time_series(df, 'Low', 'High', nn_config['time lags'])
-                    
-                # Filter the dataframe to consider the times a trade was made
-                df = get_trades(df, df_strat)
-                
-                # Add the identifier for this data, and include it on the list
-                df['ticker'] = ticker
-                dfs.append(df)
+    if pool is not None:
+        pool.shutdown()
 
     return pd.concat(dfs)
-                             
-def get_trades(df: pandasDF,
-               df_strat: pandasDF) -> pandasDF:
+
+def print_progress(num_tickers: int,
+                   total_tickers: int,
+                   num_rows: int,
+                   elapsed: float):
     '''
-    Merge the time-series dataframe with the strategy dataframe, to get nn
-    inputs that correspond to the trades made (and not other points in time)
+    Print the progress and throughput of the nn data generation
+    '''
+    elapsed = max(elapsed, 1e-9)
+    print(f'{num_tickers}/{total_tickers} tickers, {num_rows} rows, '
+          f'{num_tickers/elapsed:.1f} tickers/s, {num_rows/elapsed:.0f} rows/s')
+
+def setup_worker(nn_config: dict,
+                 strat_config: dict) -> dict:
+    '''
+    Get the state of a worker process, the price panel and configs
+    '''
+    return {'prices': panel.load_panel(rebuild = False),
+            'nn config': nn_config,
+            'strat config': strat_config,
+            }
+    
+def worker_trades(ticker: str) -> pandasDF:
+    '''
+    Produce the time-series data for the trades of a ticker in a worker process
+    '''
+    return get_ticker_trades(workers.state['prices'],
+                             ticker,
+                             workers.state['nn config'],
+                             workers.state['strat config'],
+                             )
+
+def get_ticker_trades(prices: dict,
+                      ticker: str,
+                      nn_config: dict,
+                      strat_config: dict) -> pandasDF:
+    '''
+    Run the buy/sell for a single ticker, and produce the time-series data for
+    each trade made
 
     Parameters
     ----------
-    df : pandasDF
-        The price dataframe with the time-series cols
-    df_strat : pandasDF
-        The summary of the trades made for this ticker
+    prices : dict
+        The price panel
+    ticker : str
+        The ticker to produce the data for
+    nn_config : dict
+        The config params for the nn. With 'trade anchored' set (the default),
+        the features are gathered directly at the rows each trade was bought,
+        rather than by merging the trades back onto the dates.
+    strat_config : dict
+        The config params for the trading strategy
 
     Returns
     -------
     df : pandasDF
-        The filtered df which contains the lagged time-series for the trades
+        The time-series data for each trade, None if no trades were made
     '''
-    df_strat = df_strat.rename(columns = {'Bought': 'Date'})
-    df = df.merge(df_strat, on = 'Date', how = 'inner')
+    anchored = nn_config.get('trade anchored', True)
     
-    # Drop the unecessary columns for the nn
-    return df.drop(columns = ['Sold' , 'Days held'])
+    # The trade anchored features only need the dates of the trades, so the
+    # dates are left as integers until the trades are found
+    df = panel.get_ticker_df(prices, ticker, str_dates = not anchored)
+    df = strategy.add_strat_cols(df,
+                                 strat_config,
+                                 nn_config['strat name'],
+                                 )
+    
+    # Since we only have fundamental data since 2017, there is no point
+    # searching for training data beyond that
+    if nn_config['include fundamentals']:
+        date_filter = '2017-01-01'
+    else:
+        date_filter = nn_config['lower date filter']
+        
+    if anchored:
+        date_filter = price_store.dates_to_int([date_filter])[0]
+    df = df[df['Date'] >= date_filter]
+    
+    if len(df) == 0:
+        return None
+    
+    if anchored:
+        percs, rows, _ = strategy.get_trade_arrays(df,
+                                                   strat_config,
+                                                   nn_config['strat name'],
+                                                   )
+    else:
+        df_strat, _ = strategy.run_strategy(df,
+                                            strat_config,
+                                            nn_config['strat name'],
+                                            )
+        rows = get_trade_rows(df, df_strat)
+    
+    # If no trades have been made, there are no nn features
+    if len(rows) == 0:
+        return None
         
-def time_series_returns(df: pandasDF,
-                        col: str,
-                        lags: list) -> pandasDF:
+    # Build the lagged features only for the times a trade was made
+    df = pd.concat([df.iloc[rows].reset_index(drop = True),
+                    get_features(df, rows, nn_config, strat_config),
+                    ],
+                   axis = 1,
+                   )
+    
+    # Attach the result of each trade
+    if anchored:
+        df['Date'] = price_store.int_to_dates(df['Date'].values)
+        df['Profit/Loss'] = percs
+    else:
+        df = get_trades(df, df_strat)
+    
+    # Add the identifier for this data
+    df['ticker'] = ticker
+    
+    return df
+                             
+def get_features(df: pandasDF,
+                 rows: np_arr,
+                 nn_config: dict,
+                 strat_config: dict) -> pandasDF:
     '''
-    Create a time series of percentage changes
-
-    Parameters
-    ----------
-    df : pandasDF
-        The dataframe of price data.
-    col : str
-        The column we wish to create the time series of.
-    lags : list
-        A list of integers to denote the time series points.
-
-    Returns
-    -------
-    pandasDF
-        A dataframe with the time series cols.
+    Get the lagged time-series features of the nn for rows of the price data
+    (with the strategy columns included)
     '''
-    return df.assign(**{
-        f'{col}_t-{lag}': np.log(df[col].shift(lag-1)/df[col].shift(lag))
-        for lag in lags
-        })
-
-def time_series_feats(df: pandasDF,
-                      col: str,
-                      lags: list) -> pandasDF:
+    
+    # If the bollinger squeeze is wanted, then normalise the
+    # difference between the bands by dividing by 100
+    if nn_config['strat name'] == 'bollinger squeeze':
+        df['boll_diff'] = df['boll_diff']/100
+    
+    return features.get_lag_features(df,
+                                     rows,
+                                     strat_config,
+                                     nn_config['time lags'],
+                                     )
+                             
+def get_trade_rows(df: pandasDF,
+                   df_strat: pandasDF) -> np_arr:
     '''
-    Create columns for the time series of "cols", where the lags are specified
-    in the "lags" list.
-
-    Parameters
-    ----------
-    df : pandasDF
-        The dataframe of price data.
-    col : str
-        The column we wish to create the time series of.
-    lags : list
-        A list of integers to denote the time series points.
-
-    Returns
-    -------
-    pandasDF
-        A dataframe with the time series cols.
+    Get the indexes of the rows in the price data where a trade was made
     '''
-    return df.assign(**{
-        f'{col}_t-{lag}': df[col].shift(lag)
-        for lag in lags
-        })
+    return np.flatnonzero(df['Date'].isin(df_strat['Bought']).values)
 
-def perc_diff_time_series(df: pandasDF,
-                          low: str,
-                          high: str,
-                          lags: list) -> pandasDF:
+def get_trades(df: pandasDF,
+               df_strat: pandasDF) -> pandasDF:
     '''
-    Create percentage differences between two cols, and lag the time series
+    Merge the time-series dataframe with the strategy dataframe, to get nn
+    inputs that correspond to the trades made (and not other points in time)
 
     Parameters
     ----------
     df : pandasDF
-        The dataframe of price data.
-    low : str
-        The column we wish to find the percentage change from
-    high : str
-        The column we wish to find the percentage change to
-    lags : list
-        A list of integers to denote the time series points.
+        The price dataframe with the time-series cols
+    df_strat : pandasDF
+        The summary of the trades made for this ticker
 
     Returns
     -------
-    pandasDF
-        A dataframe with the time series cols.
+    df : pandasDF
+        The filtered df which contains the lagged time-series for the trades
     '''
-    col = df[high]/df[low] - 1
-    return df.assign(**{
-        f'{high}_{low}_t-{lag}': col.shift(lag)
-        for lag in lags
-        })
+    df_strat = df_strat.rename(columns = {'Bought': 'Date'})
+    df = df.merge(df_strat, on = 'Date', how = 'inner')
+    
+    # Drop the unecessary columns for the nn
+    return df.drop(columns = ['Sold' , 'Days held'])
 
-@nb.jit(nopython=True) 
+@nb.jit(nopython=True, cache=True) 
 def labeller(percs, profit, stop):
     
     out = []
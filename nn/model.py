@@ -1,19 +1,11 @@
 import numpy as np
-import pandas as pd
 
 # Project imports
-from nn import utils
+from nn import utils, shards, pipeline, features
+from utils import price_store
 
 # Type-hinting imports
 from numpy import array as np_arr
-from pandas import DataFrame as pandasDF
-
-# NN imports
-from tensorflow.keras.regularizers import l2
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.utils import to_categorical
-from tensorflow.keras.layers import Dense, LSTM, Bidirectional, Dropout
 
 def main(nn_config: dict):
     '''
@@ -32,10 +24,17 @@ def main(nn_config: dict):
     # Adjust the config file with the saved settings from the data generation
     nn_config = utils.add_gen_config(nn_config)
     
-    data = get_nn_data(nn_config)
-    model = get_model(nn_config, data)
+    # Either stream the data from the shards, or load it all into memory
+    streaming = nn_config.get('streaming', False)
+    if streaming:
+        data = get_nn_datasets(nn_config)
+    else:
+        data = get_nn_data(nn_config)
+    
+    model = get_model(nn_config, data['input shape'])
     
     # Form the optimiser
+    from tensorflow.keras.optimizers import Adam
     optim = Adam(learning_rate = nn_config['learn rate'],
                  decay = nn_config['decay rate'],
                  )
@@ -45,77 +44,112 @@ def main(nn_config: dict):
                   optimizer = optim,
                   metrics = ['accuracy'])
     
-    # Fit the model
-    model.fit(data['x train'],
-              data['y train'],
-              epochs = nn_config['epochs'],
-              batch_size = nn_config['batch size'],
-              validation_split = nn_config['validation split'])
+    # Fit the model, and evaluate the performance. The streamed datasets are
+    # already batched, and a validation split is not supported for them.
+    if streaming:
+        model.fit(data['train'],
+                  epochs = nn_config['epochs'],
+                  )
+        score = model.evaluate(data['test'], verbose = 0)
+        test_pred = np.argmax(model.predict(data['test']), axis = 1)
+    else:
+        model.fit(data['x train'],
+                  data['y train'],
+                  epochs = nn_config['epochs'],
+                  batch_size = nn_config['batch size'],
+                  validation_split = nn_config['validation split'])
+        score = model.evaluate(data['x test'],
+                               data['y test'],
+                               verbose=0)
+        test_pred = np.argmax(model.predict(data['x test']), axis = 1)
     
     # Save the model
     model.save('nn/models/' + nn_config['model save name'])
     
-    # Evaluate performance 
-    score = model.evaluate(data['x test'],
-                           data['y test'],
-                           verbose=0)
-
     print("Test loss:", score[0])
     print("Test accuracy:", score[1])
 
     # Plot the confusion matrix
-    test_pred = np.argmax(model.predict(data['x test']), axis = 1)
-    utils.get_confusion_matrix(data['test'][:, -1].astype(int),
+    utils.get_confusion_matrix(data['test labels'],
                                test_pred,
                                nn_config,
                                'In sample test',
                                )
     return
 
-def equalise_classes(df: pandasDF) -> pandasDF:
+def ask_equalise(classes: np_arr,
+                 num_each_class: np_arr) -> bool:
     '''
     To prevent there being a large discrepency in the number of each class,
     print the number of each examples in each class, and ask whether the number
     of classes should be equalised before feeding into the nn (this reduces
     the number of training points)
+    '''
+    
+    # Print the summary
+    print('Number of examples for each class: ')
+    for n in range(0, len(num_each_class)):
+        print('Class ' + str(classes[n]) + ': ' + str(num_each_class[n]))
+    print('\nDo you wish to equalise the classes? (y/n)')
+  
+    return input() == 'y'
+
+def equalise_classes(labels: np_arr) -> np_arr:
+    '''
+    Potentially equalise the number of examples of each class, see
+    ask_equalise
 
     Parameters
     ----------
-    df : pandasDF
-        The pre-processed data to go into the nn.
+    labels : np_arr
+        The class label of each example
 
     Returns
     -------
-    df : pandasDF
-        A dataframe which has potentially been class-equalised
+    idx : np_arr
+        The indexes of the examples to keep, which have potentially been
+        class-equalised
     '''
     
     # Find how many there are of each class
-    counts = df['labels'].value_counts()
-    labels = counts.index.values
-    num_each_class = counts.values
-    
-    # Print the summary
-    print('Number of examples for each class: ')
-    for n in range(0, len(num_each_class)):
-        print('Class ' + str(labels[n]) + ': ' + str(num_each_class[n]))
-    print('\nDo you wish to equalise the classes? (y/n)')
-  
-    opt = input()
+    classes, num_each_class = np.unique(labels, return_counts = True)
     
     # If the equal classes are wanted, randomly select n examples from each class
-    if opt == 'y':
-        classes = df['labels'].unique()
+    if ask_equalise(classes, num_each_class):
         min_class_example = np.min(num_each_class)
         
         # For each class, take a random sample of examples s.t. all classes
         # have the same number of elements
-        dfs = [df[df['labels'] == c].sample(min_class_example) 
-               for c in classes]
-        return pd.concat(dfs)
+        return np.concatenate([
+            np.random.choice(np.flatnonzero(labels == c),
+                             min_class_example,
+                             replace = False,
+                             )
+            for c in classes])
 
     else:
-        return df
+        return np.arange(labels.shape[0])
+    
+def get_valid_rows(folder: str,
+                   data: dict) -> np_arr:
+    '''
+    Get the indexes of the rows with no missing or infinite features, removing
+    any duplicated trades (the same ticker and date). The features are checked
+    one shard at a time, data holds the tickers and dates of all the rows.
+    Shards are written without duplicates, so these are only in shards
+    written by older versions.
+    '''
+    finite = [start + np.flatnonzero(np.isfinite(shard['features']).all(axis = 1))
+              for start, shard in shards.iter_shards(folder)]
+    finite = np.concatenate([np.zeros(0, dtype = np.int64)] + finite)
+    
+    trades = np.stack((data['tickers'][finite].astype(np.int64),
+                       data['dates'][finite]),
+                      axis = 1,
+                      )
+    _, first = np.unique(trades, axis = 0, return_index = True)
+    
+    return finite[np.sort(first)]
     
 def get_nn_data(nn_config: dict) -> dict:
     '''
@@ -132,33 +166,36 @@ def get_nn_data(nn_config: dict) -> dict:
         The data for training and testing
     '''
     
+    from tensorflow.keras.utils import to_categorical
+    
     # Dictionary to store the outputs
     nn_data = {}
     
-    # Load in the data and drop columns not required for the nn
-    df = pd.read_csv('nn/data/' + nn_config['strat name'] + ' training.csv')
-    df = df.replace([np.inf, -np.inf], np.nan)
-    df = df.drop_duplicates().dropna()
+    # Load in the data, and remove any rows not suitable for the nn. Only the
+    # features of the rows used are read from the shards.
+    folder = shards.get_folder(nn_config['strat name'], 'training')
+    data = shards.load_arrays(folder)
+    rows = get_valid_rows(folder, data)
     
     # Split the training and testing
-    train = df[df['Date'] <= nn_config['train date']].drop(columns = ['ticker', 'Date', 'Profit/Loss'])
-    test = df[df['Date'] > nn_config['train date']].drop(columns = ['ticker', 'Date', 'Profit/Loss']).values
+    train_date = price_store.dates_to_int([nn_config['train date']])[0]
+    train = rows[data['dates'][rows] <= train_date]
+    test = rows[data['dates'][rows] > train_date]
     
     # Check if equal examples of each class is wanted
-    train = equalise_classes(train).values
+    train = train[equalise_classes(data['labels'][train])]
     
     # Shuffle the training data before passing through
     np.random.shuffle(train)
     
-    nn_data['train'] = train 
-    nn_data['x train'] = nn_data['train'][:, 0:-1].astype(np.float32)
-    nn_data['y train'] = to_categorical(nn_data['train'][:, -1].astype(int),
+    nn_data['x train'] = shards.take_rows(folder, 'features', train)
+    nn_data['y train'] = to_categorical(data['labels'][train].astype(int),
                                         nn_config['classes'])
     
-    nn_data['test'] = test 
-    nn_data['x test'] = nn_data['test'][:, 0:-1].astype(np.float32)
-    nn_data['y test'] = to_categorical(nn_data['test'][:, -1].astype(int),
-                                        nn_config['classes'])
+    nn_data['test labels'] = data['labels'][test].astype(int)
+    nn_data['x test'] = shards.take_rows(folder, 'features', test)
+    nn_data['y test'] = to_categorical(nn_data['test labels'],
+                                       nn_config['classes'])
     
     # A 3D array is required for the lstm input, so we reshape to accomodate
     if nn_config['model type'] in ['lstm', 'bidirectional']:
@@ -172,10 +209,62 @@ def get_nn_data(nn_config: dict) -> dict:
             nn_data['x test'] = reshape_rnn(nn_data['x test'],
                                             max(nn_config['time lags']),
                                             )
+            
+    nn_data['input shape'] = nn_data['x train'].shape[1:]
+    
+    return nn_data
+
+def get_nn_datasets(nn_config: dict) -> dict:
+    '''
+    Get the train/test data for the nn as datasets streamed from the shards,
+    so the data is never held in memory all at once.
+
+    Parameters
+    ----------
+    nn_config: dict
+        The config controls for the NN
+
+    Returns
+    -------
+    nn_data: dict
+        The train and test datasets, the input shape of the nn, and the labels
+        of the test data
+    '''
+    
+    # Dictionary to store the outputs
+    nn_data = {}
+    
+    folder = shards.get_folder(nn_config['strat name'], 'training')
+    nn_data['input shape'] = pipeline.get_input_shape(nn_config,
+                                                      shards.load_manifest(folder),
+                                                      )
+    
+    # Check if equal examples of each class is wanted. Rather than sampling
+    # the rows up-front, each class is kept with a probability which gives the
+    # same expected number of each class.
+    train_labels = pipeline.get_split_labels(nn_config, 'training', 'train')
+    counts = np.bincount(train_labels, minlength = nn_config['classes'])
+    
+    keep_prob = None
+    if ask_equalise(np.flatnonzero(counts), counts[counts > 0]):
+        keep_prob = counts[counts > 0].min()/np.maximum(counts, 1)
+    
+    nn_data['train'] = pipeline.get_dataset(nn_config,
+                                            'training',
+                                            'train',
+                                            shuffle = True,
+                                            keep_prob = keep_prob,
+                                            )
+    nn_data['test'] = pipeline.get_dataset(nn_config, 'training', 'test')
+    nn_data['test labels'] = pipeline.get_split_labels(nn_config,
+                                                       'training',
+                                                       'test',
+                                                       )
+    
     return nn_data
 
 def reshape_rnn(x: np_arr,
-                n_lags: range) -> np_arr:
+                n_lags: int) -> np_arr:
     '''
     If an RNN-type network is wanted, reshape the input so that it is a 3D
     array of the form (sample, time series, feature).
@@ -190,24 +279,13 @@ def reshape_rnn(x: np_arr,
     Returns
     -------
     x_new : np_arr
-        The reshaped x array for the RNN layers.
+        The reshaped x array for the RNN layers. This is a float32 view of x
+        (no copy is made if x is already float32).
     '''
-    
-    # Calculate the number of features we have in the nn (assumes all features
-    # are of the same length)
-    num_feats = x.shape[1]//n_lags
-    
-    # Initialise the new x array with the correct size
-    x_new = np.zeros((x.shape[0], n_lags, num_feats))
-    
-    # Populate this array through iteration
-    for n in range(0, num_feats):
-        x_new[:, :, n] = x[:, n*n_lags:(n+1)*n_lags]
-    
-    return x_new
+    return features.to_rnn(x.astype(np.float32, copy = False), n_lags)
 
 def get_model(nn_config: dict,
-              nn_data: dict):
+              input_shape: tuple):
     '''
     Obtain NN model (probably better written in OOP, kept it easy for now)
 
@@ -215,8 +293,8 @@ def get_model(nn_config: dict,
     ----------
     nn_config : dict
         Config controls for the nn
-    nn_data : dict
-        The data for training and testing
+    input_shape : tuple
+        The shape of a single input to the nn
 
     Returns
     -------
@@ -224,6 +302,10 @@ def get_model(nn_config: dict,
         The model architecture for training
     '''
     
+    from tensorflow.keras.regularizers import l2
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, LSTM, Bidirectional, Dropout
+    
     # RNN type nets are not supported with the fundamentals included (since
     # they are not time-series)
     if nn_config['include fundamentals']:
@@ -235,7 +317,7 @@ def get_model(nn_config: dict,
         model = Sequential([
             Dense(nn_config['nodes'],
                   activation = 'relu',
-                  input_shape = (nn_data['x train'].shape[1],),
+                  input_shape = input_shape,
                   kernel_regularizer = l2(nn_config['regularise']),
                   bias_regularizer = l2(nn_config['regularise'])),
             Dense(nn_config['nodes']//4,
@@ -253,8 +335,7 @@ def get_model(nn_config: dict,
     elif nn_type == 'lstm':
         model = Sequential([
             LSTM(nn_config['nodes'],
-                 input_shape = (nn_data['x train'].shape[1],
-                                nn_data['x train'].shape[2]),
+                 input_shape = input_shape,
                  return_sequences = True),
             Dropout(nn_config['dropout perc']),
             LSTM(nn_config['nodes']//2),
@@ -265,8 +346,7 @@ def get_model(nn_config: dict,
     elif nn_type == 'bidirectional':
         model = Sequential([
             Bidirectional(LSTM(nn_config['nodes'],
-                               input_shape = (nn_data['x train'].shape[1],
-                                              nn_data['x train'].shape[2]),
+                               input_shape = input_shape,
                                return_sequences = True),
                           ),
             Dropout(nn_config['dropout perc']),
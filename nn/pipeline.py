@@ -0,0 +1,157 @@
+'''
+Functionality for streaming the nn data from the shards into training.
+
+The shards are read one at a time (memory-mapped), and only the rows in the
+wanted train/test split are taken from each. The rows are then shuffled in a
+fixed size buffer, batched and prefetched by tf.data, so the memory used does
+not grow with the size of the dataset.
+'''
+
+import numpy as np
+
+# Project imports
+from nn import shards, features
+from utils import price_store
+
+# Other imports and type-hinting
+from numpy import array as np_arr
+
+def is_rnn(nn_config: dict) -> bool:
+    '''
+    Whether the nn takes 3D (sample, time series, feature) inputs. RNN type
+    nets are not supported with the fundamentals included.
+    '''
+    return (nn_config['model type'] in ['lstm', 'bidirectional']
+            and not nn_config['include fundamentals'])
+
+def get_input_shape(nn_config: dict,
+                    manifest: dict) -> tuple:
+    '''
+    The shape of a single input to the nn, from the columns in the shards
+    '''
+    num_cols = len(manifest['columns'])
+
+    if is_rnn(nn_config):
+        n_lags = max(nn_config['time lags'])
+        return (n_lags, num_cols//n_lags)
+
+    return (num_cols,)
+
+def get_split_rows(arrays: dict,
+                   nn_config: dict,
+                   split: str) -> np_arr:
+    '''
+    Get the rows of a shard which are in the train or test split (split by
+    the 'train date'), and have no missing or infinite features
+    '''
+    train_date = price_store.dates_to_int([nn_config['train date']])[0]
+
+    if split == 'train':
+        rows = np.flatnonzero(arrays['dates'] <= train_date)
+    else:
+        rows = np.flatnonzero(arrays['dates'] > train_date)
+
+    return rows[np.isfinite(arrays['features'][rows]).all(axis = 1)]
+
+def get_split_labels(nn_config: dict,
+                     case: str,
+                     split: str) -> np_arr:
+    '''
+    Get the labels of every row in a split, in the same order the rows are
+    streamed when not shuffled
+    '''
+    folder = shards.get_folder(nn_config['strat name'], case)
+    num_shards = len(shards.load_manifest(folder)['shards'])
+
+    labels = []
+    for n in range(num_shards):
+        arrays = shards.load_shard(folder, n)
+        labels.append(arrays['labels'][get_split_rows(arrays, nn_config, split)])
+
+    return np.concatenate(labels).astype(int)
+
+def shard_generator(nn_config: dict,
+                    case: str,
+                    split: str,
+                    shuffle: bool = False,
+                    keep_prob: np_arr = None):
+    '''
+    Generate the inputs/one-hot labels of the rows in a split, one shard at a
+    time
+
+    Parameters
+    ----------
+    nn_config : dict
+        The config controls for the nn
+    case : str
+        Which data to use, i.e. 'training' or 'testing'
+    split : str
+        Either 'train' or 'test'
+    shuffle : bool
+        Whether to shuffle the order of the shards, and the rows in each shard
+    keep_prob : np_arr
+        The probability of keeping a row of each class, used to equalise the
+        classes without holding the data in memory
+
+    Yields
+    ------
+    x, y : np_arr
+        The inputs and one-hot labels of the rows in a shard
+    '''
+    folder = shards.get_folder(nn_config['strat name'], case)
+
+    order = np.arange(len(shards.load_manifest(folder)['shards']))
+    if shuffle:
+        np.random.shuffle(order)
+
+    for n in order:
+        arrays = shards.load_shard(folder, n)
+        rows = get_split_rows(arrays, nn_config, split)
+
+        if keep_prob is not None:
+            labels = arrays['labels'][rows].astype(int)
+            rows = rows[np.random.random(rows.shape[0]) < keep_prob[labels]]
+
+        if shuffle:
+            np.random.shuffle(rows)
+
+        x = arrays['features'][rows]
+        if is_rnn(nn_config):
+            x = features.to_rnn(x, max(nn_config['time lags']))
+
+        y = np.eye(nn_config['classes'], dtype = np.float32)[arrays['labels'][rows]]
+
+        yield x, y
+
+def get_dataset(nn_config: dict,
+                case: str,
+                split: str,
+                shuffle: bool = False,
+                keep_prob: np_arr = None) -> 'tf.data.Dataset':
+    '''
+    Get a streaming dataset of the rows in a split, see shard_generator for
+    the parameters. The rows are shuffled with a buffer of 'shuffle buffer'
+    rows, and batched with the 'batch size'.
+    '''
+    # TensorFlow is only imported once a dataset is needed, so the rest of the
+    # module can be used without it
+    import tensorflow as tf
+    
+    folder = shards.get_folder(nn_config['strat name'], case)
+    input_shape = get_input_shape(nn_config, shards.load_manifest(folder))
+
+    # The generator is called again for each epoch, which reshuffles the
+    # order of the shards
+    dataset = tf.data.Dataset.from_generator(
+        lambda: shard_generator(nn_config, case, split, shuffle, keep_prob),
+        output_signature = (
+            tf.TensorSpec(shape = (None,) + input_shape, dtype = tf.float32),
+            tf.TensorSpec(shape = (None, nn_config['classes']), dtype = tf.float32),
+            ),
+        )
+    dataset = dataset.unbatch()
+
+    if shuffle:
+        dataset = dataset.shuffle(nn_config.get('shuffle buffer', 10000))
+
+    return dataset.batch(nn_config['batch size']).prefetch(tf.data.AUTOTUNE)
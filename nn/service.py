@@ -0,0 +1,378 @@
+'''
+A local inference service for the trained strategy-advisor models.
+
+The models are loaded once when the service starts and kept in memory. Each
+request is a batch of candidate buy signals (ticker + date), the nn features
+for the signals are built from the price panel, and the class/surety of each
+signal is returned. Requests arriving at the same time are grouped into a
+single call of the model (micro-batching), so scoring many signals at once
+costs about the same as scoring one.
+
+Requests are POSTed as json to /predict:
+
+    {"model": "simple ma", "signals": [{"ticker": "TSLA", "date": "2021-03-01"}]}
+
+and the response is a list with the "class" and "surety" (or an "error") of
+each signal, in the same order as the request.
+
+The date of a signal is the day the strategy gave the buy signal. The trades
+in the training data are bought on the open of the next day, and their
+features are built at that day's row, so a signal can only be scored once the
+price data includes the day after it.
+'''
+
+import json
+import time
+import queue
+import threading
+import numpy as np
+import urllib.request
+
+# Project imports
+from nn import gen_input, features, shards, strat_configs
+from utils import io, panel, price_store, strategy, warmup
+
+# Other imports and type-hinting
+from concurrent.futures import Future
+from numpy import array as np_arr
+from pandas import DataFrame as pandasDF
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The loaded models and their configs, set by start_service. The lock stops
+# requests building features at the same time, since the indicator cache is
+# shared between the request threads.
+_service = {'models': {}, 'lock': threading.Lock()}
+
+def main(service_config: dict):
+    '''
+    Load the models and run the inference service until it is interrupted
+
+    Parameters
+    ----------
+    service_config : dict
+        Config params for the service
+
+    Returns
+    -------
+    None
+    '''
+    server = start_service(service_config)
+
+    print(f'Serving {list(_service["models"].keys())} on '
+          f'http://{service_config["host"]}:{service_config["port"]}/predict')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+    return
+
+def start_service(service_config: dict) -> ThreadingHTTPServer:
+    '''
+    Load each model, start its batching thread, and create the http server
+
+    Parameters
+    ----------
+    service_config : dict
+        Config params for the service, 'models' maps the save name of each
+        model (in nn/models) to the name of the strategy it was trained on
+
+    Returns
+    -------
+    server : ThreadingHTTPServer
+        The server for the requests, which has not started serving yet
+    '''
+    warmup.compile_kernels(verbose = False)
+
+    for model_name, strat_name in service_config['models'].items():
+        _service['models'][model_name] = load_advisor(model_name,
+                                                      strat_name,
+                                                      service_config,
+                                                      )
+
+    return ThreadingHTTPServer((service_config['host'], service_config['port']),
+                               RequestHandler,
+                               )
+
+def load_advisor(model_name: str,
+                 strat_name: str,
+                 service_config: dict) -> dict:
+    '''
+    Load a model and the configs it was trained with, and start the thread
+    which runs the batches of predictions for it
+
+    Returns
+    -------
+    advisor : dict
+        The model, the nn/strategy configs, the feature columns the model was
+        trained on, whether the model takes RNN-type inputs and the queue of
+        requests for the model
+    '''
+
+    # The config used to generate the training data, which gives the lags
+    nn_config = io.load_dict('nn/data/' + strat_name)
+    if nn_config['include fundamentals']:
+        raise ValueError(f'Model {model_name} uses the fundamentals, which '
+                         'are not supported by the service.')
+
+    from tensorflow.keras.models import load_model
+    model = load_model('nn/models/' + model_name)
+
+    # The order of the feature columns in the training data
+    manifest = shards.load_manifest(shards.get_folder(nn_config['strat name'],
+                                                      'training'))
+
+    advisor = {'model': model,
+               'nn config': nn_config,
+               'strat config': strat_configs.get_config(strat_name),
+               'columns': manifest['columns'],
+               'rnn': len(model.input_shape) == 3,
+               'queue': queue.Queue(),
+               }
+
+    threading.Thread(target = run_batches,
+                     args = (advisor,
+                             service_config['max batch'],
+                             service_config['max wait']/1000,
+                             ),
+                     daemon = True,
+                     ).start()
+
+    return advisor
+
+def run_batches(advisor: dict,
+                max_batch: int,
+                max_wait: float):
+    '''
+    Run the predictions for a model, grouping the requests which arrive
+    within max_wait seconds of each other (up to max_batch signals) into one
+    call of the model. This runs forever in its own thread.
+    '''
+    while True:
+        items = [advisor['queue'].get()]
+        num_rows = items[0][0].shape[0]
+        deadline = time.perf_counter() + max_wait
+
+        while num_rows < max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                items.append(advisor['queue'].get(timeout = timeout))
+            except queue.Empty:
+                break
+            num_rows += items[-1][0].shape[0]
+
+        try:
+            x = np.concatenate([x for x, _ in items])
+            if advisor['rnn']:
+                x = features.to_rnn(x, max(advisor['nn config']['time lags']))
+            predict = advisor['model'].predict(x, verbose = 0)
+
+            # Hand each request back its own rows of the predictions
+            start = 0
+            for x, future in items:
+                future.set_result(predict[start:start + x.shape[0]])
+                start += x.shape[0]
+
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+
+def get_signal_features(advisor: dict,
+                        signals: list) -> tuple:
+    '''
+    Build the nn features for each signal from the price panel
+
+    Parameters
+    ----------
+    advisor : dict
+        The loaded model and configs, see load_advisor
+    signals : list
+        The signals to score, each a dict with the 'ticker' and the 'date' of
+        the buy signal
+
+    Returns
+    -------
+    x : np_arr
+        The features of each signal which could be built, anchored at the day
+        after the signal as in the training data
+    idx : list
+        The index in signals of each row of x
+    errors : dict
+        The error message for each signal which could not be built
+    '''
+    prices = panel.load_panel(rebuild = False)
+    nn_config = advisor['nn config']
+    strat_config = advisor['strat config']
+
+    xs = []
+    idx = []
+    errors = {}
+
+    # Group the signals by ticker, so each ticker's data is prepared once
+    tickers = {}
+    for n, signal in enumerate(signals):
+        tickers.setdefault(signal['ticker'], []).append(n)
+
+    for ticker, signal_idx in tickers.items():
+        try:
+            df = panel.get_ticker_df(prices, ticker, str_dates = False)
+            df = strategy.add_strat_cols(df,
+                                         strat_config,
+                                         nn_config['strat name'],
+                                         )
+            if df.shape[0] == 0:
+                raise ValueError('not enough data for the strategy')
+        except Exception as e:
+            errors.update({n: f'No price data for {ticker}: {e}'
+                           for n in signal_idx})
+            continue
+
+        # Find the row of each signal date, the dates are in ascending order
+        dates = price_store.dates_to_int([signals[n]['date'] for n in signal_idx])
+        rows = np.minimum(np.searchsorted(df['Date'].values, dates),
+                          df.shape[0] - 1,
+                          )
+        found = df['Date'].values[rows] == dates
+        is_signal = np.isin(rows, strategy.get_buy_signals(df,
+                                                           nn_config['strat name'],
+                                                           strat_config,
+                                                           ))
+        bought = rows + 1 < df.shape[0]
+
+        for n, row_found, row_signal, row_bought in zip(signal_idx, found,
+                                                        is_signal, bought):
+            date = signals[n]['date']
+            if not row_found:
+                errors[n] = f'No price data for {ticker} on {date}'
+            elif not row_signal:
+                errors[n] = f'{date} is not a buy signal of {ticker}'
+            elif not row_bought:
+                errors[n] = (f'The day after the signal on {date} is not in the '
+                             'price data yet')
+
+        # The features are built at the row each trade would be bought, as
+        # in the training data
+        valid = found & is_signal & bought
+        if valid.any():
+            feats = gen_input.get_features(df, rows[valid] + 1, nn_config, strat_config)
+            xs.append(get_model_columns(advisor, feats))
+            idx += np.array(signal_idx)[valid].tolist()
+
+    x = np.concatenate(xs) if xs else np.zeros((0, 0), dtype = np.float32)
+
+    return x, idx, errors
+
+def get_model_columns(advisor: dict,
+                      feats: pandasDF) -> np_arr:
+    '''
+    Put the features in the column order of the training data (from the
+    shard manifest), raising an error if the columns do not match
+    '''
+    columns = feats.columns.tolist()
+    if sorted(columns) != sorted(advisor['columns']):
+        missing = sorted(set(advisor['columns']) - set(columns))
+        extra = sorted(set(columns) - set(advisor['columns']))
+        raise ValueError('The features do not match the training data, '
+                         f'missing: {missing}, extra: {extra}')
+
+    return feats[advisor['columns']].to_numpy(dtype = np.float32)
+
+def predict_signals(model_name: str,
+                    signals: list) -> list:
+    '''
+    Score a batch of candidate buy signals with a model
+
+    Parameters
+    ----------
+    model_name : str
+        The save name of the model
+    signals : list
+        The signals to score, each a dict with the 'ticker' and 'date'
+
+    Returns
+    -------
+    results : list
+        For each signal, the predicted 'class' and the 'surety' of the
+        prediction, or an 'error' if it could not be scored
+    '''
+    if model_name not in _service['models']:
+        raise KeyError(f'Unknown model {model_name}')
+
+    advisor = _service['models'][model_name]
+    with _service['lock']:
+        x, idx, errors = get_signal_features(advisor, signals)
+
+    results = [{'ticker': s['ticker'], 'date': s['date']} for s in signals]
+    for n, error in errors.items():
+        results[n]['error'] = error
+
+    # Signals without a full history of features cannot be scored
+    valid = np.isfinite(x).all(axis = 1)
+    for n in np.array(idx, dtype = int)[~valid]:
+        results[n]['error'] = 'Not enough price history for the features'
+
+    if valid.any():
+        future = Future()
+        advisor['queue'].put((x[valid], future))
+        predict = future.result()
+
+        labels = np.argmax(predict, axis = 1)
+        surety = predict[np.arange(0, labels.shape[0]), labels]
+
+        for n, label, sure in zip(np.array(idx, dtype = int)[valid], labels, surety):
+            results[n]['class'] = int(label)
+            results[n]['surety'] = float(sure)
+
+    return results
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''
+    Handle the prediction requests, each is run in its own thread
+    '''
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            results = predict_signals(request['model'], request['signals'])
+            self.send_json(200, results)
+        except Exception as e:
+            self.send_json(400, {'error': str(e)})
+
+    def send_json(self,
+                  status: int,
+                  body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        # Keep the console for the service output, not every request
+        return
+
+def request_predictions(model_name: str,
+                        signals: list,
+                        host: str = 'localhost',
+                        port: int = 8501) -> list:
+    '''
+    Send a batch of signals to a running service, and return the predictions.
+    See predict_signals for the parameters and results.
+    '''
+    request = urllib.request.Request(f'http://{host}:{port}/predict',
+                                     data = json.dumps({'model': model_name,
+                                                        'signals': signals,
+                                                        }).encode(),
+                                     headers = {'Content-Type': 'application/json'},
+                                     )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
@@ -0,0 +1,254 @@
+'''
+Functionality for storing the nn input data as sharded binary arrays.
+
+The data for a strategy/case is written to its own folder, as a set of shards
+of at most a fixed number of rows. Each shard is a group of .npy files (the
+float32 features, and the labels, dates, profit/loss and tickers of each
+trade), which can be memory-mapped when training. A small manifest describes
+the columns and the shards.
+'''
+
+import os
+import json
+import time
+import shutil
+import numpy as np
+
+# Project imports
+from utils import price_store
+
+# Other imports and type-hinting
+from numpy import array as np_arr
+from pandas import DataFrame as pandasDF
+
+# The columns which describe each trade, rather than being a feature
+META_COLS = ['Date', 'ticker', 'Profit/Loss', 'labels']
+
+# The arrays stored in each shard, and their data types
+SHARD_ARRAYS = {'features': np.float32,
+                'labels': np.int8,
+                'dates': np.int64,
+                'profit': np.float64,
+                'tickers': np.int32,
+                }
+
+# The arrays describing each trade, which are small enough to always load
+# for the whole dataset
+TRADE_ARRAYS = ['labels', 'dates', 'profit', 'tickers']
+
+def get_folder(strat_name: str,
+               case: str) -> str:
+    '''
+    The folder the shards are stored in for a strategy and case (i.e.
+    'training' or 'testing')
+    '''
+    return f'nn/data/{strat_name} {case}'
+
+def get_shard_path(folder: str,
+                   array: str,
+                   shard: int) -> str:
+    '''
+    The path to one of the arrays of a shard
+    '''
+    return f'{folder}/{array}_{shard:04d}.npy'
+
+def write_shards(df: pandasDF,
+                 folder: str,
+                 shard_rows: int = 100000):
+    '''
+    Write the nn input data into shards, replacing any existing data in the
+    folder. Duplicated trades (the same ticker and date, e.g. from a ticker
+    being picked twice) are only written once, so every reader of the shards
+    sees each trade once.
+
+    Parameters
+    ----------
+    df : pandasDF
+        The nn input data, with the feature columns along with the date,
+        ticker, profit/loss and label of each trade
+    folder : str
+        The folder to write the shards to
+    shard_rows : int
+        The maximum number of rows in each shard
+
+    Returns
+    -------
+    None
+    '''
+
+    df = df.drop_duplicates(subset = ['ticker', 'Date'])
+
+    # Write everything to a temporary folder first, so a reader never sees a
+    # partially written dataset
+    tmp_folder = folder + '.tmp'
+    if os.path.isdir(tmp_folder):
+        shutil.rmtree(tmp_folder)
+    os.makedirs(tmp_folder)
+
+    columns = [col for col in df.columns if col not in META_COLS]
+    tickers = sorted(df['ticker'].unique().tolist())
+
+    arrays = {'features': df[columns].to_numpy(dtype = np.float32),
+              'labels': df['labels'].to_numpy(),
+              'dates': price_store.dates_to_int(df['Date'].values),
+              'profit': df['Profit/Loss'].to_numpy(),
+              'tickers': np.searchsorted(tickers, df['ticker'].values),
+              }
+
+    shards = []
+    for n, start in enumerate(range(0, df.shape[0], shard_rows)):
+        stop = min(start + shard_rows, df.shape[0])
+        for array, dtype in SHARD_ARRAYS.items():
+            np.save(get_shard_path(tmp_folder, array, n),
+                    arrays[array][start:stop].astype(dtype),
+                    )
+        shards.append(stop - start)
+
+    manifest = {'created': time.time(),
+                'columns': columns,
+                'tickers': tickers,
+                'rows': int(df.shape[0]),
+                'shards': shards,
+                }
+
+    with open(f'{tmp_folder}/manifest.json', 'w') as f:
+        json.dump(manifest, f)
+
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    os.replace(tmp_folder, folder)
+
+    return
+
+def load_manifest(folder: str) -> dict:
+    '''
+    Load the manifest describing the shards in a folder
+    '''
+    with open(f'{folder}/manifest.json') as f:
+        return json.load(f)
+
+def load_shard(folder: str,
+               shard: int,
+               mmap: bool = True) -> dict:
+    '''
+    Load the arrays of a single shard
+
+    Parameters
+    ----------
+    folder : str
+        The folder the shards are stored in
+    shard : int
+        The number of the shard to load
+    mmap : bool
+        Whether to memory-map the arrays (read-only) rather than reading them
+
+    Returns
+    -------
+    arrays : dict
+        The features, labels, dates (days since the epoch), profit and ticker
+        (index into the manifest tickers) arrays
+    '''
+    return {array: np.load(get_shard_path(folder, array, shard),
+                           mmap_mode = 'r' if mmap else None,
+                           )
+            for array in SHARD_ARRAYS.keys()}
+
+def iter_shards(folder: str):
+    '''
+    Iterate over the shards in a folder, loading (memory-mapping) one shard
+    at a time
+
+    Yields
+    ------
+    start : int
+        The row of the whole dataset the shard starts at
+    arrays : dict
+        The arrays of the shard, see load_shard
+    '''
+    start = 0
+    for n, num_rows in enumerate(load_manifest(folder)['shards']):
+        yield start, load_shard(folder, n)
+        start += num_rows
+
+def get_empty_array(manifest: dict,
+                    array: str) -> np_arr:
+    '''
+    An array with no rows, of the same type and shape as in the shards
+    '''
+    shape = (0, len(manifest['columns'])) if array == 'features' else (0,)
+
+    return np.zeros(shape, dtype = SHARD_ARRAYS[array])
+
+def load_arrays(folder: str,
+                arrays: list = None) -> dict:
+    '''
+    Load arrays for all the rows in a folder, joining the shards together.
+    By default the features are not loaded, since they are much larger than
+    the other arrays, use take_rows to get the features of just the rows
+    needed.
+
+    Parameters
+    ----------
+    folder : str
+        The folder the shards are stored in
+    arrays : list
+        The names of the arrays to load (see SHARD_ARRAYS), defaults to
+        TRADE_ARRAYS
+
+    Returns
+    -------
+    data : dict
+        The arrays for all the rows, and the manifest
+    '''
+    if arrays is None:
+        arrays = TRADE_ARRAYS
+
+    manifest = load_manifest(folder)
+    data = {array: [get_empty_array(manifest, array)] for array in arrays}
+
+    for _, shard in iter_shards(folder):
+        for array in arrays:
+            data[array].append(shard[array])
+
+    data = {array: np.concatenate(data[array]) for array in arrays}
+    data['manifest'] = manifest
+
+    return data
+
+def take_rows(folder: str,
+              array: str,
+              rows: np_arr) -> np_arr:
+    '''
+    Read an array for a set of rows of the whole dataset, only reading the
+    rows wanted from each shard
+
+    Parameters
+    ----------
+    folder : str
+        The folder the shards are stored in
+    array : str
+        The name of the array (see SHARD_ARRAYS)
+    rows : np_arr
+        The rows to read, in any order
+
+    Returns
+    -------
+    values : np_arr
+        The array for each of the rows, in the same order as rows
+    '''
+    manifest = load_manifest(folder)
+    rows = np.asarray(rows, dtype = np.int64)
+
+    empty = get_empty_array(manifest, array)
+    values = np.empty((rows.shape[0],) + empty.shape[1:], dtype = empty.dtype)
+
+    # The shard each row is in
+    starts = np.cumsum([0] + manifest['shards'])
+    shard_of = np.searchsorted(starts, rows, side = 'right') - 1
+
+    for n in np.unique(shard_of):
+        in_shard = shard_of == n
+        shard = np.load(get_shard_path(folder, array, n), mmap_mode = 'r')
+        values[in_shard] = shard[rows[in_shard] - starts[n]]
+
+    return values
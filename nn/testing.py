@@ -1,6 +1,4 @@
 import numpy as np
-import pandas as pd
-from tensorflow.keras.models import load_model
 
 # For type hinting
 from typing import Tuple
@@ -8,7 +6,7 @@ from numpy import array as np_arr
 from pandas import DataFrame as pandasDF
 
 # Project imports
-from nn import strat_configs, model, utils
+from nn import strat_configs, model, utils, shards
     
 def main(config):
     '''
@@ -33,15 +31,22 @@ def main(config):
     strat_config = strat_configs.get_config(config['strat name'])
     
     # Get the testing data
-    df_test, data, true_labels = get_testing_data(config,
-                                                  strat_config,
-                                                  )
+    folder = shards.get_folder(config['strat name'], 'testing')
+    df_test, true_labels = get_testing_data(config,
+                                            strat_config,
+                                            )
+    if df_test.shape[0] == 0:
+        raise ValueError(f'There is no testing data in {folder}')
     
     # Load in the nn model for the predictions
+    from tensorflow.keras.models import load_model
     nn_model = load_model('nn/models/' + config['model save name'])
     
-    # Make the predictions and find the class labels
-    predict = nn_model.predict(data.astype('float32'))
+    # Make the predictions one shard at a time, so the features are never all
+    # held in memory, and find the class labels
+    predict = np.concatenate([nn_model.predict(get_model_input(shard['features'],
+                                                               config))
+                              for _, shard in shards.iter_shards(folder)])
     labels = np.argmax(predict, axis = 1)
     
     # Make a new df to signify the return
@@ -62,9 +67,10 @@ def main(config):
     return get_stats(df_test, config)
     
 def get_testing_data(config: dict,
-                     strat_config: dict) -> Tuple[pandasDF, np_arr, np_arr]:
+                     strat_config: dict) -> Tuple[pandasDF, np_arr]:
     '''
-    Get the input numpy array for the dat
+    Get the profit/loss and labels of the testing trades. The features are
+    read one shard at a time when predicting, see get_model_input.
 
     Parameters
     ----------
@@ -77,26 +83,32 @@ def get_testing_data(config: dict,
     -------
     df : pandasDF
         The testing dataframe, filtered to only the ticker/profit/label columns
-    data : np_arr
-        The data to feed into the NN
     labels: np_arr
         The true labels for the confusion matrix
     '''
     
-    # Load in the dataframe with the tickers to test with
-    df = pd.read_csv('nn/data/' + config['strat name'] + ' testing.csv')
+    # Load in the arrays for the tickers to test with
+    arrays = shards.load_arrays(shards.get_folder(config['strat name'],
+                                                  'testing'))
     
-    # Reset the index of the dataframe to remove the set with copy warning
-    df = df.reset_index().drop(columns = ['index', 'ticker', 'Date'])
+    df = pandasDF({'Profit/Loss': arrays['profit'],
+                   'labels': arrays['labels'].astype(int),
+                   })
     
-    # Change the df to values, and reshape if an LSTM-type network has been used
-    data = df.values[:, :-2]
+    return df, df['labels'].values
+
+def get_model_input(features: np_arr,
+                    config: dict) -> np_arr:
+    '''
+    Get the input to the nn from the features of the testing trades
+    '''
+    # Reshape if an LSTM-type network has been used
     if config['model type'] in ['lstm', 'bidirectional']:
-        data = model.reshape_rnn(data,
+        return model.reshape_rnn(features,
                                  max(config['time lags']),
                                  )
     
-    return df[['Profit/Loss', 'labels']], data, df['labels'].values
+    return features.astype('float32', copy = False)
 
 def get_stats(df: pandasDF,
               config: dict):
@@ -3,8 +3,6 @@ Any random utilities for the NN training/testing
 '''
 
 import numpy as np
-from matplotlib import pyplot as plt
-from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 
 # For type hinting
 from numpy import array as np_arr
@@ -59,9 +57,12 @@ def get_confusion_matrix(true_labels: np_arr,
     -------
     None
     '''    
+    from matplotlib import pyplot as plt
+    from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
+    
     cm = confusion_matrix(y_true = true_labels,
                           y_pred = pred_labels)
-    cm_scaled = cm/cm.astype(np.float).sum(axis = 0)
+    cm_scaled = cm/cm.astype(float).sum(axis = 0)
     
     disp = ConfusionMatrixDisplay(confusion_matrix = cm_scaled)
     disp.plot()
@@ -15,6 +15,24 @@ if __name__ == "__main__":
                  'num tickers': 15, # Number of tickers to optimise over
                  'num evolutions': 50, # Number of evolutions to perform
                  'keep perc': 0.2, # Percentage of top models to keep on each evolution
+                 'seed': None, # Seed for the random number generators, None for a random run
+                 
+                 # Number of processes to calculate the fitness with, 1 runs
+                 # everything in this process
+                 'workers': 1,
+                 
+                 # Backtest the whole population on each ticker in a single
+                 # compiled call, rather than one strategy at a time
+                 'batch backtest': True,
+                 
+                 # Caching of previously evaluated strategies. The cache file
+                 # keeps the results between runs, None to not save them
+                 'cache size': 10000, # Maximum number of strategies to keep
+                 'cache file': None, # e.g. 'ga/strategies/fitness_cache'
+                 
+                 # Memory limit (per process) for caching the moving averages
+                 # and std devs calculated for each ticker
+                 'indicator cache mb': 512,
                  
                  # What to optimise, can be 'win rate', 'avg profit', 'median profit'
                  'fitness': 'win rate',
@@ -0,0 +1,23 @@
+'''
+Main function to run the inference service for the trained nn models
+'''
+from nn import service
+
+if __name__ == "__main__":
+    
+    # Configuration settings for the service
+    service_config = {# The save name of each model to serve (in nn/models),
+                      # and the strategy it was trained on
+                      'models': {'simple ma': 'simple ma crossover'},
+                      
+                      'host': 'localhost',
+                      'port': 8501,
+                      
+                      # Requests arriving within 'max wait' milliseconds of
+                      # each other are predicted together, up to 'max batch'
+                      # signals at a time
+                      'max batch': 4096,
+                      'max wait': 5,
+                      }
+    
+    service.main(service_config)
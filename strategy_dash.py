@@ -1,7 +1,17 @@
-import pandas as pd
 import streamlit as st
 
-from utils import dash, strategy
+from utils import dash, strategy, price_store, warmup
+
+# Compile the strategy kernels once per dash session, after which streamlit
+# reruns only pay the run time
+@st.experimental_singleton
+def compile_kernels() -> dict:
+    '''
+    Compile the numba kernels, and print the compile/run times
+    '''
+    return warmup.compile_kernels()
+
+compile_kernels()
 
 # Initialise the dictionary for the config opts
 config = {}
@@ -70,9 +80,9 @@ config['fast days'] = int(config['fast days'])
 
 # Run the strategy -----------------------------------------------------------
 
-df = pd.read_csv(f'data/{ticker}.csv')
-df = strategy.add_strat_cols(df, config)
-df_summary, stats = strategy.run_strategy(df, config)
+df = price_store.load_price_df(ticker)
+df = strategy.add_strat_cols(df, config, 'simple ma crossover')
+df_summary, stats = strategy.run_strategy(df, config, 'simple ma crossover')
 
 # Main dash ------------------------------------------------------------------
 
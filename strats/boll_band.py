@@ -8,6 +8,9 @@ import numpy as np
 from numpy import array as np_arr
 from pandas import DataFrame as pandasDF
 
+# Project imports
+from utils import indicators
+
 def add_boll_col(df: pandasDF,
                  col_name: str,
                  mean_price_field: str,
@@ -44,15 +47,18 @@ def add_boll_col(df: pandasDF,
     df : pandasDF
         The price data with a bollinger band column added
     '''
-    if mean_type == 'exp':
-        mean = df[mean_price_field].ewm(span = mean_days, adjust = False).mean()
-    else:
-        mean = df[mean_price_field].rolling(mean_days).mean()
-
-    if std_type == 'exp':
-        std = df[std_price_field].ewm(span = std_days, adjust = False).std()
-    else:
-        std = df[std_price_field].rolling(std_days).std()
+    mean = indicators.get_series(df,
+                                 mean_price_field,
+                                 'mean',
+                                 mean_type,
+                                 mean_days,
+                                 )
+    std = indicators.get_series(df,
+                                std_price_field,
+                                'std',
+                                std_type,
+                                std_days,
+                                )
         
     df[col_name] = mean + boll_fact*std
     
@@ -8,6 +8,9 @@ import numpy as np
 from numpy import array as np_arr
 from pandas import DataFrame as pandasDF
 
+# Project imports
+from utils import indicators
+
 def add_ma_col(df: pandasDF,
                speed: str,
                mean_type: str,
@@ -35,11 +38,12 @@ def add_ma_col(df: pandasDF,
         The input df with the moving average column calculated
     '''
     
-    if mean_type == 'exp':
-        df[f'{speed}_ma'] = df[price_field].ewm(span = avg_days,
-                                                adjust = False).mean()
-    else:
-        df[f'{speed}_ma'] = df[price_field].rolling(avg_days).mean()
+    df[f'{speed}_ma'] = indicators.get_series(df,
+                                              price_field,
+                                              'mean',
+                                              mean_type,
+                                              avg_days,
+                                              )
     
     return df
 
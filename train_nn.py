@@ -23,6 +23,11 @@ if __name__ == "__main__":
                  'regularise': 1e-3,
                  'validation split': 0.1,
                  
+                 # Stream the data from disk rather than loading it all into
+                 # memory (the validation split is not used when streaming)
+                 'streaming': False,
+                 'shuffle buffer': 10000, # Number of examples to shuffle between
+                 
                  'out sample test': True,
                  
                  # Minimum class level to use in the testing
@@ -0,0 +1,324 @@
+'''
+Functionality for downloading the fundamental statements from AlphaVantage.
+
+Each ticker needs one call per statement (income statement, balance sheet and
+cash flow), and each reply holds both the annual and quarterly reports, so
+the six statement csv files of a ticker take three calls. The calls are made
+concurrently, but are limited by a token bucket sized to the API quota.
+
+The download jobs are kept in a json file, which records the statement files
+written by each completed job and how many calls were used on each day. If a
+run fails or is interrupted, the next run carries on with the jobs which are
+left. The url of the API can be changed, so the downloader can be run against
+a local stand-in server (see utils/single_scripts/fake_alpha_vantage.py).
+'''
+
+import os
+import json
+import time
+import asyncio
+import datetime
+import urllib.parse
+import urllib.request
+import pandas as pd
+
+# Project imports
+from utils import fundamentals
+
+# The AlphaVantage function for each statement
+FUNCTIONS = {'IS': 'INCOME_STATEMENT',
+             'BS': 'BALANCE_SHEET',
+             'CF': 'CASH_FLOW',
+             }
+
+# The key of the reports for each period in a reply
+REPORTS = {'annual': 'annualReports',
+           'quarterly': 'quarterlyReports',
+           }
+
+# Keys of the messages sent instead of the data. These are used both when
+# the rate limit is hit and for other problems (e.g. an invalid API key or a
+# premium-only function), so the message text is checked for the rate limit.
+MESSAGE_KEYS = ['Note', 'Information']
+LIMIT_PHRASES = ['call frequency', 'rate limit']
+
+def main(download_config: dict) -> dict:
+    '''
+    Download the statements for all the tickers, carrying on from any jobs
+    left from a previous run
+
+    Parameters
+    ----------
+    download_config : dict
+        Config params for the downloader
+
+    Returns
+    -------
+    queue : dict
+        The job queue after the run, see load_queue
+    '''
+    queue = load_queue(download_config['job file'],
+                       download_config['tickers'],
+                       )
+
+    asyncio.run(run_jobs(queue, download_config))
+
+    status = [job['status'] for job in queue['jobs'].values()]
+    print(f'\nJobs done: {status.count("done")}, '
+          f'failed: {status.count("failed")}, '
+          f'pending: {status.count("pending")}')
+
+    failed = sorted({job['ticker'] for job in queue['jobs'].values()
+                     if job['status'] == 'failed'})
+    if failed:
+        print(f'Failed tickers: {failed}')
+
+    return queue
+
+def get_statement_paths(ticker: str,
+                        sheet: str) -> list:
+    '''
+    The statement files written by the job for a ticker and statement
+    '''
+    return [fundamentals.get_statement_path(ticker, period, sheet)
+            for period in REPORTS.keys()]
+
+def load_queue(path: str,
+               ticker_list: list) -> dict:
+    '''
+    Load the job queue, adding a job for each statement of any new tickers.
+    Jobs marked as done whose files have since been removed are redone.
+
+    Parameters
+    ----------
+    path : str
+        The path to the job file
+    ticker_list : list
+        The tickers to download the statements for
+
+    Returns
+    -------
+    queue : dict
+        jobs : the 'ticker', 'sheet', 'status' (pending, done or failed),
+            number of 'attempts', last 'error' and written 'files' of each job
+        calls : the number of API calls made on each day
+    '''
+    if os.path.isfile(path):
+        with open(path) as f:
+            queue = json.load(f)
+    else:
+        queue = {'jobs': {}, 'calls': {}}
+
+    for ticker in ticker_list:
+        for sheet in FUNCTIONS.keys():
+            key = f'{ticker} {sheet}'
+            job = queue['jobs'].get(key)
+
+            if job is None:
+                queue['jobs'][key] = {'ticker': ticker,
+                                      'sheet': sheet,
+                                      'status': 'pending',
+                                      'attempts': 0,
+                                      'error': None,
+                                      'files': [],
+                                      }
+
+            elif job['status'] == 'done':
+                if not all(os.path.isfile(s) for s in job['files']):
+                    job['status'] = 'pending'
+
+            # Jobs which failed on a previous run are given another go
+            elif job['status'] == 'failed':
+                job['status'] = 'pending'
+                job['attempts'] = 0
+
+    save_queue(queue, path)
+
+    return queue
+
+def save_queue(queue: dict,
+               path: str):
+    '''
+    Save the job queue, via a temporary file so the queue is never left
+    partially written
+    '''
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(queue, f, indent = 1)
+    os.replace(tmp_path, path)
+
+def get_bucket(calls_per_minute: float,
+               burst: int) -> dict:
+    '''
+    Get a token bucket, which holds up to burst tokens and refills at the
+    rate of the API quota. Each API call takes one token.
+    '''
+    return {'rate': calls_per_minute/60,
+            'capacity': burst,
+            'tokens': burst,
+            'time': time.monotonic(),
+            'lock': asyncio.Lock(),
+            }
+
+async def take_token(bucket: dict):
+    '''
+    Wait until a token is in the bucket, and take it
+    '''
+    async with bucket['lock']:
+        while True:
+            now = time.monotonic()
+            bucket['tokens'] = min(bucket['capacity'],
+                                   bucket['tokens'] + (now - bucket['time'])*bucket['rate'])
+            bucket['time'] = now
+
+            if bucket['tokens'] >= 1:
+                bucket['tokens'] -= 1
+                return
+
+            await asyncio.sleep((1 - bucket['tokens'])/bucket['rate'])
+
+def download_statement(ticker: str,
+                       sheet: str,
+                       download_config: dict) -> tuple:
+    '''
+    Make the API call for a statement of a ticker, and write the annual and
+    quarterly reports into the data folder. This blocks, so is run in a
+    thread by the downloader.
+
+    Returns
+    -------
+    limited : bool
+        Whether the rate limit was hit, in which case nothing is written
+    files : list
+        The statement files written
+    '''
+    query = urllib.parse.urlencode({'function': FUNCTIONS[sheet],
+                                    'symbol': ticker,
+                                    'apikey': download_config['api key'],
+                                    })
+
+    with urllib.request.urlopen(f'{download_config["base url"]}?{query}',
+                                timeout = download_config['timeout']) as response:
+        reply = json.loads(response.read())
+
+    for key in MESSAGE_KEYS:
+        if key in reply:
+            if any(phrase in reply[key].lower() for phrase in LIMIT_PHRASES):
+                return True, []
+
+            # Any other message is an error, which is retried up to the 'max
+            # attempts'
+            raise ValueError(reply[key])
+
+    if 'Error Message' in reply:
+        raise ValueError(reply['Error Message'])
+
+    files = []
+    for period, path in zip(REPORTS.keys(), get_statement_paths(ticker, sheet)):
+        if len(reply.get(REPORTS[period], [])) == 0:
+            raise ValueError(f'No {period} reports in the reply')
+
+        # Write to a temporary file first, so a statement file is never left
+        # partially written
+        pd.DataFrame(reply[REPORTS[period]]).to_csv(path + '.tmp', index = False)
+        os.replace(path + '.tmp', path)
+        files.append(path)
+
+    return False, files
+
+async def run_jobs(queue: dict,
+                   download_config: dict):
+    '''
+    Run the pending jobs in the queue with several concurrent workers, until
+    they are all done/failed or the day's quota of calls is used up. The
+    queue is saved after each job.
+    '''
+    today = datetime.date.today().isoformat()
+    queue['calls'] = {today: queue['calls'].get(today, 0)}
+
+    pending = asyncio.Queue()
+    for key, job in queue['jobs'].items():
+        if job['status'] == 'pending':
+            pending.put_nowait(key)
+
+    state = {'bucket': get_bucket(download_config['calls per minute'],
+                                  download_config.get('burst', 1)),
+             'limited': 0,
+             'stop': False,
+             }
+
+    workers = [asyncio.create_task(run_worker(pending, queue, download_config, state))
+               for _ in range(download_config['workers'])]
+    await asyncio.gather(*workers)
+
+    if state['stop']:
+        print('Stopped early, the remaining jobs will be run next time.')
+
+    save_queue(queue, download_config['job file'])
+
+async def run_worker(pending: asyncio.Queue,
+                     queue: dict,
+                     download_config: dict,
+                     state: dict):
+    '''
+    Take jobs from the pending queue and run them, until there are none left
+    or the run is stopped
+    '''
+    loop = asyncio.get_running_loop()
+    today = datetime.date.today().isoformat()
+
+    while not state['stop'] and not pending.empty():
+        key = pending.get_nowait()
+        job = queue['jobs'][key]
+
+        await take_token(state['bucket'])
+
+        # Stop once the day's quota is used up, leaving the job pending
+        if queue['calls'][today] >= download_config['calls per day']:
+            state['stop'] = True
+            break
+        queue['calls'][today] += 1
+
+        try:
+            limited, files = await loop.run_in_executor(None,
+                                                        download_statement,
+                                                        job['ticker'],
+                                                        job['sheet'],
+                                                        download_config,
+                                                        )
+        except Exception as e:
+            job['attempts'] += 1
+            job['error'] = f'{type(e).__name__}: {e}'
+
+            if job['attempts'] < download_config['max attempts']:
+                pending.put_nowait(key)
+            else:
+                job['status'] = 'failed'
+                print(f'{key} - failed download ({job["error"]})')
+
+            save_queue(queue, download_config['job file'])
+            continue
+
+        if limited:
+            # Empty the bucket so every worker waits before the next call, and
+            # stop if the limit keeps being hit (i.e. the quota is used up)
+            state['limited'] += 1
+            state['bucket']['tokens'] = 0
+            pending.put_nowait(key)
+
+            if state['limited'] >= download_config['max limited'] and not state['stop']:
+                print('The API rate limit keeps being hit, stopping.')
+                state['stop'] = True
+            continue
+
+        state['limited'] = 0
+        job['status'] = 'done'
+        job['error'] = None
+        job['files'] = files
+        print(f'{key} - done')
+
+        save_queue(queue, download_config['job file'])
@@ -0,0 +1,213 @@
+'''
+Functionality for storing the derived fundamental features of each ticker.
+
+Deriving the fundamental metrics/F-scores means reading six statement csv
+files, merging them and as-of merging the quarterly and annual results. This
+is done once per ticker and the resulting feature table is stored as a numpy
+archive, which is only rebuilt when one of the statement files is modified or
+the feature derivation itself changes (see FEATURE_VERSION).
+'''
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Project imports
+from utils import fundamentals, price_store
+
+# Other imports and type-hinting
+from pandas import DataFrame as pandasDF
+
+# Folder the fundamental features are stored in
+STORE_DIR = 'data/fund_store'
+
+# Increase this whenever the features produced by get_all_fundamentals change,
+# so that any stored features built by older code are rebuilt
+FEATURE_VERSION = 1
+
+def get_store_path(ticker: str) -> str:
+    '''
+    The path to the stored fundamental features for a ticker
+    '''
+    return f'{STORE_DIR}/{ticker}.npz'
+
+def get_source_paths(ticker: str) -> list:
+    '''
+    The paths to every statement file the features of a ticker are built from
+    '''
+    return [fundamentals.get_statement_path(ticker, period, sheet)
+            for period in fundamentals.PERIODS
+            for sheet in fundamentals.SHEETS]
+
+def check_folder():
+    '''
+    Check if the fundamentals store folder exists, if not, create it
+    '''
+    if not os.path.isdir(STORE_DIR):
+        os.makedirs(STORE_DIR)
+
+def is_stale(ticker: str) -> bool:
+    '''
+    Check if the stored features for a ticker are missing, were built by an
+    older FEATURE_VERSION or with different outlier handling, or are older
+    than any of the statement files.
+    '''
+    store_path = get_store_path(ticker)
+    if not os.path.isfile(store_path):
+        return True
+
+    with np.load(store_path) as store:
+        if int(store['version']) != FEATURE_VERSION:
+            return True
+        if 'outliers' not in store:
+            return True
+        if str(store['outliers']) != json.dumps(fundamentals.OUTLIERS):
+            return True
+
+    # If there are no statements then the store is the only copy of the data
+    source_times = [os.path.getmtime(path) for path in get_source_paths(ticker)
+                    if os.path.isfile(path)]
+
+    return len(source_times) > 0 and max(source_times) > os.path.getmtime(store_path)
+
+def build_ticker(ticker: str):
+    '''
+    Derive the fundamental features for a single ticker from its statement
+    files, and save them in the store
+
+    Parameters
+    ----------
+    ticker : str
+        The ticker to build the features for
+
+    Returns
+    -------
+    None
+    '''
+    check_folder()
+
+    fund = fundamentals.get_all_fundamentals(ticker)
+    cols = [col for col in fund.columns if col != 'fiscal_quarter']
+
+    # Write to a temporary file first, so that another process never loads a
+    # partially written archive (see price_store.convert_ticker)
+    tmp_path = price_store.get_tmp_path(get_store_path(ticker))
+    try:
+        np.savez(tmp_path,
+                 version = np.int64(FEATURE_VERSION),
+                 outliers = np.array(json.dumps(fundamentals.OUTLIERS)),
+                 fiscal_quarter = price_store.dates_to_int(fund['fiscal_quarter'].values),
+                 columns = np.array(cols),
+                 values = fund[cols].to_numpy(dtype = np.float64),
+                 )
+        os.replace(tmp_path, get_store_path(ticker))
+    except BaseException:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return
+
+def build_all(ticker_list: list):
+    '''
+    Build the stored features for all tickers given, skipping any which are
+    already up to date. The tickers which could not be built are reported.
+    '''
+    for ticker in ticker_list:
+        if is_stale(ticker):
+            try:
+                build_ticker(ticker)
+            except Exception as e:
+                print(f'Could not build the fundamentals for {ticker}: {e}')
+
+    return
+
+def load_fund_arrays(ticker: str) -> dict:
+    '''
+    Load the fundamental features for a ticker, building them first if they
+    are missing or out of date.
+
+    Parameters
+    ----------
+    ticker : str
+        The ticker to load the features for
+
+    Returns
+    -------
+    arrays : dict
+        The 'fiscal_quarter' dates (days since the epoch, ascending), the
+        feature 'columns' names and the (row x column) feature 'values'
+    '''
+    if is_stale(ticker):
+        build_ticker(ticker)
+
+    with np.load(get_store_path(ticker)) as store:
+        arrays = {'fiscal_quarter': store['fiscal_quarter'],
+                  'columns': store['columns'].tolist(),
+                  'values': store['values'],
+                  }
+
+    return arrays
+
+def load_fund_df(ticker: str) -> pandasDF:
+    '''
+    Load the fundamental features for a ticker as a dataframe, in the same
+    format as fundamentals.get_all_fundamentals
+    '''
+    arrays = load_fund_arrays(ticker)
+
+    df = pandasDF(arrays['values'], columns = arrays['columns'])
+    df.insert(0, 'fiscal_quarter', price_store.int_to_dates(arrays['fiscal_quarter']))
+
+    return df
+
+def load_fund_panel(ticker_list: list) -> tuple:
+    '''
+    Load the fundamental features for many tickers into one table, ready for
+    an as-of join on the date (grouped by ticker)
+
+    Parameters
+    ----------
+    ticker_list : list
+        The tickers to load the features for
+
+    Returns
+    -------
+    fund : pandasDF
+        The 'date' (days since the epoch), 'ticker', 'fiscal_quarter' and
+        features of every statement, sorted by the date
+    failures : dict
+        The reason each ticker which could not be loaded failed
+    '''
+    dfs = []
+    failures = {}
+
+    for ticker in ticker_list:
+        # Any problem with one ticker's statements or store (e.g. a truncated
+        # archive) is reported, and the other tickers are still loaded
+        try:
+            arrays = load_fund_arrays(ticker)
+        except Exception as e:
+            failures[ticker] = f'{type(e).__name__}: {e}'
+            continue
+
+        df = pandasDF(arrays['values'], columns = arrays['columns'])
+        df.insert(0, 'date', arrays['fiscal_quarter'])
+        df.insert(1, 'ticker', ticker)
+        df.insert(2, 'fiscal_quarter', price_store.int_to_dates(arrays['fiscal_quarter']))
+        dfs.append(df)
+
+    if len(dfs) == 0:
+        return pandasDF({'date': np.zeros(0, dtype = np.int64),
+                         'ticker': np.zeros(0, dtype = object),
+                         'fiscal_quarter': np.zeros(0, dtype = object),
+                         }), failures
+
+    fund = pd.concat(dfs, ignore_index = True)
+
+    # Each ticker is already in date order, so a stable sort keeps the
+    # statements of a ticker in order when they share a date
+    fund = fund.iloc[np.argsort(fund['date'].values, kind = 'stable')]
+
+    return fund.reset_index(drop = True), failures
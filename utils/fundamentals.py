@@ -9,6 +9,25 @@ from utils import dates
 from functools import reduce
 from pandas import DataFrame as pandasDF
 
+# The statement periods, and the statements (Cash Flow, Balance Sheet and
+# Income Statement) downloaded for each period
+PERIODS = ['annual', 'quarterly']
+SHEETS = ['CF', 'BS', 'IS']
+
+# How outliers in the fundamental features are handled (see filter_outliers)
+OUTLIERS = {'mode': 'drop',
+            'limit': 50.,
+            'quantiles': [0.01, 0.99],
+            }
+
+def get_statement_path(ticker: str,
+                       period: str,
+                       sheet: str) -> str:
+    '''
+    The path to a downloaded statement csv file for a ticker
+    '''
+    return f'data/{ticker}_{period}_{sheet}.csv'
+
 def load_fundamental_data(ticker: str, 
                           period: str) -> pandasDF:
     '''
@@ -29,8 +48,8 @@ def load_fundamental_data(ticker: str,
     '''
     
     # Load in the cash-flow, balance sheet and income statement
-    dfs = [pd.read_csv(f'data/{ticker}_{period}_{sheet}.csv')
-           for sheet in ['CF', 'BS', 'IS']]
+    dfs = [pd.read_csv(get_statement_path(ticker, period, sheet))
+           for sheet in SHEETS]
     
     # Merge all the dataframes such that all fundamentals are in one wide dataframe
     df = reduce(lambda left, right: pd.merge(left, right, 
@@ -192,7 +211,8 @@ def get_all_metrics(ticker: str,
                           how = 'left',
                           )
 
-def get_all_fundamentals(ticker: str) -> pandasDF:
+def get_all_fundamentals(ticker: str,
+                         outliers: dict = OUTLIERS) -> pandasDF:
     '''
     Get both the quarterly and annual fundamentals metrics and F-scores in one
     dataframe.
@@ -201,11 +221,14 @@ def get_all_fundamentals(ticker: str) -> pandasDF:
     ----------
     ticker : str
         The ticker to load the data for
+    outliers : dict
+        How to handle the outliers, see filter_outliers
 
     Returns
     -------
     fund : pandasDF
-        The dataframe containing the quarterly and yearly fundamental metrics
+        The dataframe containing the quarterly and yearly fundamental metrics,
+        with the outlier counts of each column in fund.attrs['outliers']
     '''
     
     # Get quarterly data, and adjust such that there is a date range in which
@@ -233,7 +256,88 @@ def get_all_fundamentals(ticker: str) -> pandasDF:
     cols = fund.select_dtypes(include=np.number).columns.tolist()
     
     # Filter any outliers that appear in the df
-    for col in cols:
-        fund = fund[(fund[col] < 50) & (fund[col] > -50)]
+    num_rows = fund.shape[0]
+    fund, counts = filter_outliers(fund, cols, outliers)
+    fund.attrs['outliers'] = counts
+    print_outliers(ticker, counts, outliers['mode'], num_rows, fund.shape[0])
+    
+    return fund
+
+def print_outliers(ticker: str,
+                   counts: dict,
+                   mode: str,
+                   rows_before: int,
+                   rows_after: int):
+    '''
+    Print how many outliers were handled in each column of a ticker's
+    fundamentals, if there were any
+    '''
+    counts = {col: count for col, count in counts.items() if count > 0}
+    if not counts:
+        return
+    
+    cols = ', '.join([f'{col}: {count}' for col, count in counts.items()])
+    if mode == 'drop':
+        print(f'{ticker}: dropped {rows_before - rows_after} of {rows_before} '
+              f'statements with outliers ({cols})')
+    else:
+        verb = 'clipped' if mode == 'clip' else 'winsorised'
+        print(f'{ticker}: {verb} {sum(counts.values())} outlier values ({cols})')
+
+def filter_outliers(df: pandasDF,
+                    cols: list,
+                    outliers: dict = OUTLIERS) -> tuple:
+    '''
+    Handle the outliers in the numerical columns of a dataframe. All columns
+    are checked at once on a single array, rather than filtering the
+    dataframe once per column.
+
+    Parameters
+    ----------
+    df : pandasDF
+        The dataframe to filter
+    cols : list
+        The numerical columns to check for outliers
+    outliers : dict
+        mode : either 'drop' (remove any row with a value outside of +/-
+            limit, or a missing/infinite value), 'clip' (clip the values to
+            +/- limit) or 'winsorise' (clip the values of each column to the
+            given quantiles of that column)
+        limit : the largest absolute value allowed for the drop/clip modes
+        quantiles : the lower and upper quantiles for the winsorise mode
+
+    Returns
+    -------
+    df : pandasDF
+        The filtered dataframe
+    counts : dict
+        For each column, the number of rows removed (drop) or values clipped
+        (clip/winsorise) because of that column. A row with outliers in more
+        than one column is counted against each of them.
+    '''
+    x = df[cols].to_numpy(dtype = np.float64)
+    
+    if outliers['mode'] == 'winsorise':
+        # Infinite values would stop the quantiles being found
+        lower, upper = np.nanquantile(np.where(np.isfinite(x), x, np.nan),
+                                      outliers['quantiles'],
+                                      axis = 0,
+                                      )
+    elif outliers['mode'] in ['drop', 'clip']:
+        lower, upper = -outliers['limit'], outliers['limit']
+    else:
+        raise ValueError(f'Unknown outlier mode {outliers["mode"]}')
+    
+    if outliers['mode'] == 'drop':
+        # Missing values fail both comparisons, so are dropped as before
+        bad = ~((x > lower) & (x < upper))
+        counts = dict(zip(cols, bad.sum(axis = 0).tolist()))
+        return df[~bad.any(axis = 1)], counts
+    
+    bad = (x < lower) | (x > upper)
+    counts = dict(zip(cols, bad.sum(axis = 0).tolist()))
+    
+    df = df.copy()
+    df[cols] = np.clip(x, lower, upper)
     
-    return fund
\ No newline at end of file
+    return df, counts
@@ -0,0 +1,352 @@
+'''
+Functionality for calculating (and caching) the moving average and standard
+deviation series used by the strategies.
+
+Rolling means/std devs are calculated together by a numba kernel, which
+slides the window along the data updating the mean and sum of squared
+deviations as each value enters and leaves. The first time a rolling window of
+a price field is requested, the series for every window size from MIN_DAYS to
+MAX_DAYS (the range the strategies search over) are calculated in one
+parallel call and cached, so later strategies only look them up.
+'''
+
+import numpy as np
+import numba as nb
+import pandas as pd
+
+# For type hinting
+from typing import Tuple
+from collections import OrderedDict
+from numpy import array as np_arr
+from pandas import DataFrame as pandasDF
+
+# The price data loaders store an identifier of the data in df.attrs under
+# this name. Only dataframes with an identifier have their indicators cached.
+KEY_ATTR = 'cache key'
+
+# The range of rolling window sizes calculated together
+MIN_DAYS = 3
+MAX_DAYS = 300
+
+# The cached series, along with the memory used and the hit/miss counters
+_cache = {'entries': OrderedDict(),
+          'bytes': 0,
+          'max bytes': 512*1024**2,
+          'hits': 0,
+          'misses': 0,
+          }
+
+def set_cache_size(max_bytes: int):
+    '''
+    Set the maximum memory (in bytes) the cached series may use. The least
+    recently used series are evicted beyond this, a size of 0 disables the
+    cache.
+    '''
+    _cache['max bytes'] = max_bytes
+    evict()
+
+def clear_cache():
+    '''
+    Remove all the cached series
+    '''
+    _cache['entries'].clear()
+    _cache['bytes'] = 0
+
+def cache_info() -> dict:
+    '''
+    Get the number of cached series, the memory they use and the hit/miss
+    counters
+    '''
+    return {'series': len(_cache['entries']),
+            'bytes': _cache['bytes'],
+            'hits': _cache['hits'],
+            'misses': _cache['misses'],
+            }
+
+def evict():
+    '''
+    Evict the least recently used series until the cache is within its size
+    '''
+    while _cache['bytes'] > _cache['max bytes'] and _cache['entries']:
+        _, arr = _cache['entries'].popitem(last = False)
+        _cache['bytes'] -= arr.nbytes
+
+def cache_get(key: tuple):
+    '''
+    Get an entry from the cache, returns None if it has not been cached
+    '''
+    if key in _cache['entries']:
+        _cache['hits'] += 1
+        _cache['entries'].move_to_end(key)
+        return _cache['entries'][key]
+
+    _cache['misses'] += 1
+    return None
+
+def cache_put(key: tuple,
+              arr: np_arr):
+    '''
+    Add an entry to the cache, evicting the least recently used if full
+    '''
+    if key in _cache['entries']:
+        _cache['bytes'] -= _cache['entries'][key].nbytes
+    _cache['entries'][key] = arr
+    _cache['bytes'] += arr.nbytes
+    evict()
+
+def get_data_key(df: pandasDF) -> tuple:
+    '''
+    Get the identifier of the price data in a dataframe, or None if it has
+    none. pandas copies the attrs to frames derived from df (e.g. by dropna
+    or slicing), so the length and first/last index of the rows are included
+    to tell a trimmed frame apart from the full price data.
+    '''
+    data_key = df.attrs.get(KEY_ATTR)
+    if data_key is None or len(df) == 0:
+        return None
+
+    return (data_key, len(df), df.index[0], df.index[-1])
+
+def get_series(df: pandasDF,
+               price_field: str,
+               stat: str,
+               mean_type: str,
+               days: int) -> np_arr:
+    '''
+    Get a moving average or standard deviation series of a price field. If the
+    dataframe has a cache key, the series is only calculated the first time it
+    is requested for that price data.
+
+    Parameters
+    ----------
+    df : pandasDF
+        Price data
+    price_field : str
+        Which price column to consider
+    stat : str
+        Either 'mean' or 'std'
+    mean_type : str
+        To determine if the average is rolling, or exponential
+    days : int
+        Number of days to calculate the average over
+
+    Returns
+    -------
+    series : np_arr
+        The moving average/standard deviation for each row of the df
+    '''
+    data_key = get_data_key(df)
+    if data_key is None:
+        return calc_series(df, price_field, stat, mean_type, days)
+
+    key = (data_key, price_field, stat, mean_type, int(days))
+    series = cache_get(key)
+    if series is not None:
+        return series
+
+    if mean_type == 'exp':
+        series = {(stat, int(days)): calc_series(df, price_field, stat, mean_type, days)}
+    elif MIN_DAYS <= days <= MAX_DAYS:
+        series = get_window_chunk(df[price_field].values, int(days))
+    else:
+        series = dict(zip([('mean', int(days)), ('std', int(days))],
+                          rolling_series(df[price_field].values, int(days))))
+
+    for (name, window), arr in series.items():
+        window_key = (data_key, price_field, name, mean_type, window)
+
+        # Windows which are still cached are left as they are
+        if window_key in _cache['entries'] and window != int(days):
+            continue
+
+        # The same array is handed to every strategy, so make sure it cannot
+        # be modified in place
+        arr.flags.writeable = False
+        cache_put(window_key, arr)
+
+    return series[(stat, int(days))]
+
+def get_window_chunk(x: np_arr,
+                     days: int) -> dict:
+    '''
+    Calculate the rolling means and std devs of x for the chunk of window
+    sizes containing days. Normally the chunk is every window from MIN_DAYS
+    to MAX_DAYS, but it is cut down so that it never takes more than an
+    eighth of the cache.
+
+    Returns
+    -------
+    series : dict
+        The series for each ('mean' or 'std', window size)
+    '''
+    num_windows = MAX_DAYS - MIN_DAYS + 1
+    window_bytes = 2*8*max(len(x), 1)
+    chunk = max(1, min(num_windows, _cache['max bytes']//(8*window_bytes)))
+
+    min_days = MIN_DAYS + ((days - MIN_DAYS)//chunk)*chunk
+    max_days = min(min_days + chunk - 1, MAX_DAYS)
+    means, stds = rolling_matrix(x, min_days, max_days)
+
+    # The series are rows of the matrices, whose memory is freed once every
+    # row of the chunk has been evicted
+    series = {}
+    for w, window in enumerate(range(min_days, max_days + 1)):
+        series[('mean', window)] = means[w]
+        series[('std', window)] = stds[w]
+
+    return series
+
+def calc_series(df: pandasDF,
+                price_field: str,
+                stat: str,
+                mean_type: str,
+                days: int) -> np_arr:
+    '''
+    Calculate a moving average or standard deviation series of a price field,
+    see get_series for the parameters
+    '''
+    if mean_type == 'exp':
+        window = df[price_field].ewm(span = days, adjust = False)
+        if stat == 'std':
+            return window.std().values
+        return window.mean().values
+
+    mean, std = rolling_series(df[price_field].values, int(days))
+
+    if stat == 'std':
+        return std
+
+    return mean
+
+def rolling_series(x: np_arr,
+                   days: int) -> Tuple[np_arr, np_arr]:
+    '''
+    Calculate the rolling mean and std dev (ddof = 1, as in pandas) of x.
+    Series with missing values are left to pandas, which skips them.
+    '''
+    # Always copy, since x can be a read-only (and strided) view of the
+    # memory-mapped panel. numba compiles a separate signature for those,
+    # which the warmup does not cover.
+    x = np.array(x, dtype = np.float64)
+    if np.isnan(x).any():
+        window = pd.Series(x).rolling(days)
+        return window.mean().values, window.std().values
+
+    return rolling_mean_std(x, days)
+
+def rolling_matrix(x: np_arr,
+                   min_days: int = MIN_DAYS,
+                   max_days: int = MAX_DAYS) -> Tuple[np_arr, np_arr]:
+    '''
+    Calculate the rolling means and std devs of x for every window size from
+    min_days to max_days in one call, see rolling_series
+
+    Returns
+    -------
+    means, stds : np_arr
+        Arrays of shape (window, row), where row w of the arrays is for the
+        window size min_days + w
+    '''
+    x = np.array(x, dtype = np.float64)
+    if np.isnan(x).any():
+        windows = [rolling_series(x, days) for days in range(min_days, max_days + 1)]
+        return (np.array([mean for mean, _ in windows]),
+                np.array([std for _, std in windows]))
+
+    return rolling_matrix_kernel(x, min_days, max_days)
+
+@nb.njit(cache = True)
+def window_moments(x: np_arr,
+                   start: int,
+                   stop: int) -> Tuple[float, float]:
+    '''
+    The mean and sum of squared deviations from the mean of x[start:stop],
+    calculated directly (in two passes)
+    '''
+    mean = 0.
+    for j in range(start, stop):
+        mean += x[j]
+    mean /= stop - start
+
+    ssd = 0.
+    for j in range(start, stop):
+        ssd += (x[j] - mean)*(x[j] - mean)
+
+    return mean, ssd
+
+@nb.njit(cache = True)
+def rolling_mean_std(x: np_arr,
+                     days: int) -> Tuple[np_arr, np_arr]:
+    '''
+    The rolling mean and std dev (ddof = 1) of x for one window size
+    '''
+    mean = np.empty(x.shape[0])
+    std = np.empty(x.shape[0])
+    fill_rolling(x, days, mean, std)
+
+    return mean, std
+
+@nb.njit(cache = True, parallel = True)
+def rolling_matrix_kernel(x: np_arr,
+                          min_days: int,
+                          max_days: int) -> Tuple[np_arr, np_arr]:
+    '''
+    The rolling means and std devs of x for every window size in a range,
+    each window size is filled in parallel
+    '''
+    num_windows = max_days - min_days + 1
+    means = np.empty((num_windows, x.shape[0]))
+    stds = np.empty((num_windows, x.shape[0]))
+
+    for w in nb.prange(num_windows):
+        fill_rolling(x, min_days + w, means[w], stds[w])
+
+    return means, stds
+
+@nb.njit(cache = True)
+def fill_rolling(x: np_arr,
+                 days: int,
+                 mean: np_arr,
+                 std: np_arr):
+    '''
+    Fill the rolling mean and std dev (ddof = 1) of x for one window size,
+    rows without a full window are nan.
+
+    The window is slid along x one row at a time, updating the mean and sum of
+    squared deviations for the value leaving and entering (Welford's update).
+    The rounding errors of the updates build up, so the moments are
+    recalculated directly at the start of every block of days rows. Windows
+    where every value is the same have a std dev of exactly 0.
+    '''
+    n = x.shape[0]
+    mean[:] = np.nan
+    std[:] = np.nan
+
+    m = 0.
+    ssd = 0.
+    same = 0
+
+    for i in range(n):
+        # The number of equal values in a row, ending at row i
+        same = same + 1 if i > 0 and x[i] == x[i-1] else 1
+
+        if i < days - 1:
+            continue
+
+        if (i - days + 1) % days == 0:
+            m, ssd = window_moments(x, i - days + 1, i + 1)
+        else:
+            new, old = x[i], x[i-days]
+            m_new = m + (new - old)/days
+            ssd += (new - old)*(new - m_new + old - m)
+            m = m_new
+
+        if same >= days:
+            mean[i] = x[i]
+            var = 0.
+        else:
+            mean[i] = m
+            var = ssd/(days - 1) if days > 1 else np.nan
+
+        # Rounding can leave a tiny negative variance
+        std[i] = np.sqrt(var) if var > 0 else (0. if days > 1 else np.nan)
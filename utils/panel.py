@@ -0,0 +1,368 @@
+'''
+Functionality for a memory-mapped panel of daily price data for all tickers.
+
+All tickers are stacked into one (row x field) float64 array on disk, with an
+offsets index giving the contiguous block of rows belonging to each ticker.
+Opening the panel memory-maps the arrays read-only, so several processes
+running at the same time share one copy through the OS page cache.
+'''
+
+import os
+import json
+import time
+import uuid
+import numpy as np
+
+# Project imports
+from utils import price_store, indicators
+
+# Other imports and type-hinting
+from pandas import DataFrame as pandasDF
+
+# Folder the panel is stored in, and the file describing the current build
+PANEL_DIR = 'data/panel'
+META_PATH = f'{PANEL_DIR}/meta.json'
+
+# Lock file held while the panel is built, and the age (in seconds) after
+# which a lock is assumed to be left over from a build which crashed
+LOCK_PATH = f'{PANEL_DIR}/build.lock'
+LOCK_TIMEOUT = 600
+
+def check_folder():
+    '''
+    Check if the panel folder exists, if not, create it
+    '''
+    if not os.path.isdir(PANEL_DIR):
+        os.makedirs(PANEL_DIR)
+
+def get_csv_tickers() -> list:
+    '''
+    Get all tickers with downloaded price data (ignoring the fundamental
+    statement files, which also live in the data folder).
+    '''
+    return sorted([s.split('.csv')[0] for s in os.listdir('data/')
+                   if s.endswith('.csv') and '_' not in s])
+
+def is_stale() -> bool:
+    '''
+    Check if the panel (or the arrays of its current build) is missing, if
+    price data csv files have been added or removed since the panel was
+    built, or if any of them has been modified since.
+    '''
+    if not os.path.isfile(META_PATH):
+        return True
+
+    with open(META_PATH) as f:
+        meta = json.load(f)
+
+    # The arrays of the build may have been removed
+    for array in ['values', 'dates']:
+        if not os.path.isfile(get_array_path(array, meta['build'])):
+            return True
+
+    # Tickers skipped for having different price fields still count as built,
+    # otherwise the panel would always be stale
+    csv_tickers = get_csv_tickers()
+    if sorted(meta['tickers'] + meta.get('skipped', [])) != csv_tickers:
+        return True
+
+    csv_times = [os.path.getmtime(price_store.get_csv_path(ticker))
+                 for ticker in csv_tickers]
+
+    return len(csv_times) > 0 and max(csv_times) > meta['built']
+
+def get_array_path(array: str,
+                   build_id: str) -> str:
+    '''
+    The path to one of the arrays ('values' or 'dates') of a panel build
+    '''
+    return f'{PANEL_DIR}/{array}_{build_id}.npy'
+
+def acquire_lock():
+    '''
+    Wait until no other process is building the panel, and take the lock. The
+    lock file is created atomically, so only one process can hold it.
+    '''
+    check_folder()
+
+    while True:
+        try:
+            fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return
+        except FileExistsError:
+            pass
+
+        # Take over a lock left by a build which never finished
+        try:
+            if time.time() - os.path.getmtime(LOCK_PATH) > LOCK_TIMEOUT:
+                os.remove(LOCK_PATH)
+                continue
+        except OSError:
+            continue
+
+        time.sleep(0.1)
+
+def release_lock():
+    '''
+    Release the lock on building the panel
+    '''
+    try:
+        os.remove(LOCK_PATH)
+    except FileNotFoundError:
+        pass
+
+def build_panel(ticker_list: list = None,
+                only_if_stale: bool = False):
+    '''
+    Build the memory-mapped panel from the downloaded price data
+
+    Parameters
+    ----------
+    ticker_list : list
+        The tickers to include in the panel, defaults to all downloaded tickers
+    only_if_stale : bool
+        Whether to skip the build if the panel is up to date once the lock is
+        taken, i.e. another process has just built it
+
+    Returns
+    -------
+    None
+    '''
+    # Only one process builds the panel at a time, otherwise one build could
+    # remove the arrays of another
+    acquire_lock()
+    try:
+        if not (only_if_stale and not is_stale()):
+            write_panel(ticker_list)
+    finally:
+        release_lock()
+
+    return
+
+def write_panel(ticker_list: list = None):
+    '''
+    Write a new build of the panel, and remove the previous builds. Must only
+    be called while holding the lock, see build_panel.
+    '''
+    check_folder()
+
+    if ticker_list is None:
+        ticker_list = get_csv_tickers()
+
+    # Load every ticker once, and only keep those which have the same fields
+    # as the first ticker so the panel has a consistent set of columns
+    data = {}
+    skipped = []
+    fields = None
+    for ticker in ticker_list:
+        arrays = price_store.load_price_arrays(ticker)
+        ticker_fields = [k for k in arrays.keys() if k != 'Date']
+
+        if fields is None:
+            fields = ticker_fields
+
+        if set(ticker_fields) == set(fields):
+            data[ticker] = arrays
+        else:
+            print(f'Ticker {ticker} has different price fields, skipping.')
+            skipped.append(ticker)
+
+    if fields is None:
+        raise ValueError('There is no price data to build the panel from, '
+                         'download the data into the data folder first.')
+
+    tickers = list(data.keys())
+    lengths = [data[ticker]['Date'].shape[0] for ticker in tickers]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+
+    # Each build writes its arrays under a new id, and the meta file is swapped
+    # in last. Processes holding the previous build open are not affected.
+    build_id = uuid.uuid4().hex
+    values = np.lib.format.open_memmap(get_array_path('values', build_id),
+                                       mode = 'w+',
+                                       dtype = np.float64,
+                                       shape = (int(offsets[-1]), len(fields)),
+                                       )
+    dates = np.lib.format.open_memmap(get_array_path('dates', build_id),
+                                      mode = 'w+',
+                                      dtype = np.int64,
+                                      shape = (int(offsets[-1]),),
+                                      )
+
+    for n, ticker in enumerate(tickers):
+        start, stop = offsets[n], offsets[n+1]
+        dates[start:stop] = data[ticker]['Date']
+        for col, field in enumerate(fields):
+            values[start:stop, col] = data[ticker][field]
+
+    values.flush()
+    dates.flush()
+    del values, dates
+
+    meta = {'build': build_id,
+            'built': time.time(),
+            'tickers': tickers,
+            'skipped': skipped,
+            'fields': fields,
+            'offsets': offsets.tolist(),
+            }
+
+    tmp_path = META_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, META_PATH)
+
+    remove_old_builds(build_id)
+
+    return
+
+def remove_old_builds(build_id: str):
+    '''
+    Remove the array files from any previous panel builds. This is only done
+    while holding the build lock, after the meta file has been switched to
+    build_id, so the current build is never removed. On some platforms a file
+    cannot be removed while another process has it mapped, in which case it
+    is left for a later build to clean up.
+    '''
+    for s in os.listdir(PANEL_DIR):
+        if s.endswith('.npy') and build_id not in s:
+            try:
+                os.remove(f'{PANEL_DIR}/{s}')
+            except OSError:
+                pass
+
+def load_panel(rebuild: bool = True) -> dict:
+    '''
+    Open the memory-mapped price panel.
+
+    Parameters
+    ----------
+    rebuild : bool
+        Whether to (re)build the panel first if it is missing or out of date
+
+    Returns
+    -------
+    panel : dict
+        build : the id of this build of the panel
+        tickers : the tickers in the panel
+        fields : the price field of each column in values
+        offsets : the start row of each ticker (and the total number of rows)
+        index : ticker -> (start, stop) rows in the panel
+        dates : the dates of each row, as days since the epoch
+        values : the (row x field) price data
+    '''
+    if rebuild and is_stale():
+        build_panel(only_if_stale = True)
+
+    # A build by another process could replace the arrays between reading the
+    # meta file and opening them, in which case the new build is opened
+    for attempt in range(3):
+        with open(META_PATH) as f:
+            meta = json.load(f)
+
+        try:
+            dates = np.load(get_array_path('dates', meta['build']), mmap_mode = 'r')
+            values = np.load(get_array_path('values', meta['build']), mmap_mode = 'r')
+            break
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+            time.sleep(0.1)
+
+    offsets = np.array(meta['offsets'], dtype = np.int64)
+
+    return {'build': meta['build'],
+            'tickers': meta['tickers'],
+            'fields': meta['fields'],
+            'offsets': offsets,
+            'index': {ticker: (int(offsets[n]), int(offsets[n+1]))
+                      for n, ticker in enumerate(meta['tickers'])},
+            'dates': dates,
+            'values': values,
+            }
+
+def get_ticker_arrays(panel: dict,
+                      ticker: str) -> dict:
+    '''
+    Get read-only views of the price data for a single ticker
+
+    Parameters
+    ----------
+    panel : dict
+        The price panel
+    ticker : str
+        The ticker to get the data for
+
+    Returns
+    -------
+    arrays : dict
+        The 'Date' (days since the epoch) and price field arrays
+    '''
+    start, stop = panel['index'][ticker]
+
+    arrays = {'Date': panel['dates'][start:stop]}
+    for col, field in enumerate(panel['fields']):
+        arrays[field] = panel['values'][start:stop, col]
+
+    return arrays
+
+def get_ticker_df(panel: dict,
+                  ticker: str,
+                  str_dates: bool = True) -> pandasDF:
+    '''
+    Get the price data for a single ticker as a dataframe, in the same format
+    as reading the downloaded csv file. Tickers not in the panel are loaded
+    from the price store instead.
+
+    Parameters
+    ----------
+    panel : dict
+        The price panel
+    ticker : str
+        The ticker to get the data for
+    str_dates : bool
+        Whether to convert the dates to 'YYYY-MM-DD' strings, or leave them as
+        days since the epoch (which is cheaper when the dates are not used)
+
+    Returns
+    -------
+    df : pandasDF
+        The daily price data
+    '''
+    if ticker not in panel['index']:
+        df = price_store.load_price_df(ticker)
+        if not str_dates:
+            df['Date'] = price_store.dates_to_int(df['Date'].values)
+        return df
+
+    start, stop = panel['index'][ticker]
+
+    dates = panel['dates'][start:stop]
+    if str_dates:
+        dates = price_store.int_to_dates(dates)
+
+    df = pandasDF(panel['values'][start:stop], columns = panel['fields'])
+    df.insert(0, 'Date', dates)
+    
+    # Identify the data so the strategy indicators can be cached
+    df.attrs[indicators.KEY_ATTR] = (ticker, panel['build'], start)
+
+    return df
+
+def get_data_version(panel: dict,
+                     tickers: list) -> str:
+    '''
+    Identify the price data of a set of tickers, which changes whenever their
+    data is updated. This is the panel build, along with the modification
+    time of the csv file of any ticker which is not in the panel (and so is
+    loaded from the price store).
+    '''
+    missing = {}
+    for ticker in sorted(tickers):
+        if ticker not in panel['index']:
+            path = price_store.get_csv_path(ticker)
+            missing[ticker] = os.path.getmtime(path) if os.path.isfile(path) else None
+
+    return json.dumps([panel['build'], missing])
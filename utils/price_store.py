@@ -0,0 +1,189 @@
+'''
+Functionality for storing the daily price data in a columnar binary format.
+
+The csv files downloaded into the data folder are converted once into a numpy
+archive per ticker (float64 price/volume columns and integer dates), which is
+much cheaper to load than re-parsing the text on every run.
+'''
+
+import os
+import uuid
+import numpy as np
+import pandas as pd
+
+# Project imports
+from utils import indicators
+
+# Other imports and type-hinting
+from pandas import DataFrame as pandasDF
+
+# Folder the converted price data is stored in
+STORE_DIR = 'data/store'
+
+def get_csv_path(ticker: str) -> str:
+    '''
+    The path to the downloaded csv file for a ticker
+    '''
+    return f'data/{ticker}.csv'
+
+def get_store_path(ticker: str) -> str:
+    '''
+    The path to the converted price data for a ticker
+    '''
+    return f'{STORE_DIR}/{ticker}.npz'
+
+def get_tmp_path(path: str) -> str:
+    '''
+    A unique temporary path to write a file to before moving it into place.
+    It is in the same folder as the path (so the move is atomic) and keeps
+    the file extension (np.savez adds '.npz' to paths without it).
+    '''
+    root, ext = os.path.splitext(path)
+    return f'{root}.{os.getpid()}-{uuid.uuid4().hex}.tmp{ext}'
+
+def check_folder():
+    '''
+    Check if the price store folder exists, if not, create it
+    '''
+    if not os.path.isdir(STORE_DIR):
+        os.makedirs(STORE_DIR)
+
+def is_stale(ticker: str) -> bool:
+    '''
+    Check if the converted price data for a ticker is missing, or is older
+    than the csv file it was converted from.
+    '''
+    store_path = get_store_path(ticker)
+    if not os.path.isfile(store_path):
+        return True
+
+    # If there is no csv then the store is the only copy of the data
+    csv_path = get_csv_path(ticker)
+    if not os.path.isfile(csv_path):
+        return False
+
+    return os.path.getmtime(csv_path) > os.path.getmtime(store_path)
+
+def dates_to_int(dates: np.ndarray) -> np.ndarray:
+    '''
+    Convert an array of 'YYYY-MM-DD' date strings into the number of days
+    since the epoch.
+    '''
+    return np.asarray(dates, dtype = 'datetime64[D]').astype(np.int64)
+
+def int_to_dates(dates: np.ndarray) -> np.ndarray:
+    '''
+    Convert an array of days since the epoch back into 'YYYY-MM-DD' strings,
+    which is the date format used throughout the rest of the code.
+    '''
+    return np.datetime_as_string(np.asarray(dates).astype('datetime64[D]'))
+
+def convert_ticker(ticker: str):
+    '''
+    Convert the csv price data for a single ticker into the price store
+
+    Parameters
+    ----------
+    ticker : str
+        The ticker to convert the data for
+
+    Returns
+    -------
+    None
+    '''
+    check_folder()
+
+    df = pd.read_csv(get_csv_path(ticker))
+
+    # Every column except the date is stored as a float64 array
+    fields = [col for col in df.columns if col != 'Date']
+    arrays = {field: df[field].values.astype(np.float64) for field in fields}
+
+    # Write to a temporary file first, so that another process never loads a
+    # partially written archive. Each writer uses its own temporary file, as
+    # several processes can convert the same ticker at once.
+    tmp_path = get_tmp_path(get_store_path(ticker))
+    try:
+        np.savez(tmp_path,
+                 Date = dates_to_int(df['Date'].values),
+                 fields = np.array(fields),
+                 **arrays,
+                 )
+        os.replace(tmp_path, get_store_path(ticker))
+    except BaseException:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return
+
+def convert_all(ticker_list: list = None):
+    '''
+    Convert the csv price data into the price store for all tickers given. If
+    no tickers are given, all the downloaded tickers are converted. Tickers
+    that are already up to date are skipped.
+    '''
+
+    # The fundamental data also lives in the data folder, so only consider
+    # files without the statement suffixes
+    if ticker_list is None:
+        ticker_list = [s.split('.csv')[0] for s in os.listdir('data/')
+                       if s.endswith('.csv') and '_' not in s]
+
+    for ticker in ticker_list:
+        if is_stale(ticker):
+            convert_ticker(ticker)
+
+    return
+
+def load_price_arrays(ticker: str) -> dict:
+    '''
+    Load the price data for a ticker as a dictionary of numpy arrays. The data
+    is converted from the csv file the first time it is requested (or whenever
+    the csv file has been updated since).
+
+    Parameters
+    ----------
+    ticker : str
+        The ticker to load the data for
+
+    Returns
+    -------
+    arrays : dict
+        The 'Date' (days since the epoch) and price field arrays
+    '''
+    if is_stale(ticker):
+        convert_ticker(ticker)
+
+    with np.load(get_store_path(ticker)) as store:
+        fields = store['fields'].tolist()
+        arrays = {'Date': store['Date']}
+        arrays.update({field: store[field] for field in fields})
+
+    return arrays
+
+def load_price_df(ticker: str) -> pandasDF:
+    '''
+    Load the price data for a ticker as a dataframe, in the same format as
+    reading the downloaded csv file.
+
+    Parameters
+    ----------
+    ticker : str
+        The ticker to load the data for
+
+    Returns
+    -------
+    df : pandasDF
+        The daily price data
+    '''
+    arrays = load_price_arrays(ticker)
+    arrays['Date'] = int_to_dates(arrays['Date'])
+    
+    df = pandasDF(arrays)
+    
+    # Identify the data so the strategy indicators can be cached
+    df.attrs[indicators.KEY_ATTR] = (ticker,
+                                     os.path.getmtime(get_store_path(ticker)))
+
+    return df
@@ -0,0 +1,120 @@
+'''
+Check the batched backtest (strategy.run_strategy_batch) gives the same
+statistics as backtesting each strategy on its own (strategy.run_strategy).
+
+Random strategies are run on made-up price data, both clean and with missing
+values part way through the data (as sometimes come from yahoo finance). Run
+from the top folder of the repo with:
+
+    python -m utils.single_scripts.backtest_parity
+
+The script exits with an error if any of the statistics differ.
+'''
+
+import sys
+import random
+import numpy as np
+
+# Project imports
+import strats as strat_lib
+from utils import strategy
+
+# Other imports and type-hinting
+from pandas import DataFrame as pandasDF
+
+# The constraints used to generate the random strategies
+GA_CONFIG = {'max hold': 10,
+             'max stop': -7,
+             'min profit': 1,
+             }
+
+STRATS = {'simple ma crossover': strat_lib.ma_crossover,
+          'simple bollinger band': strat_lib.boll_band,
+          'bollinger squeeze': strat_lib.boll_squeeze,
+          }
+
+def get_prices(n: int,
+               missing: dict) -> pandasDF:
+    '''
+    Make up a random walk of daily prices, with missing values in the given
+    rows of each column
+    '''
+    Open = 20*np.exp(np.cumsum(np.random.normal(0, 0.02, n)))
+    Close = Open*np.exp(np.random.normal(0, 0.01, n))
+
+    df = pandasDF({'Date': np.arange(n, dtype = np.int64),
+                   'Open': Open,
+                   'High': np.maximum(Open, Close)*(1 + np.random.uniform(0, 0.03, n)),
+                   'Low': np.minimum(Open, Close)*(1 - np.random.uniform(0, 0.03, n)),
+                   'Close': Close,
+                   'Adj Close': Close,
+                   'Volume': np.random.uniform(1e5, 1e6, n),
+                   })
+
+    for col, rows in missing.items():
+        df.loc[rows, col] = np.nan
+
+    return df
+
+def check_strat(strat_name: str,
+                df: pandasDF,
+                num_strats: int) -> int:
+    '''
+    Run random strategies through both backtests, and print any differences
+
+    Returns
+    -------
+    num_diffs : int
+        The number of strategies with different statistics
+    '''
+    configs = [STRATS[strat_name].get_random_strat(GA_CONFIG)
+               for _ in range(num_strats)]
+
+    batch = strategy.run_strategy_batch(df.copy(), configs, strat_name)
+
+    num_diffs = 0
+    for config, batch_stats in zip(configs, batch):
+        df_strat = strategy.add_strat_cols(df.copy(), config, strat_name)
+        _, stats = strategy.run_strategy(df_strat, config, strat_name,
+                                         stats_only = True)
+
+        diffs = [name for name in strategy.STAT_NAMES
+                 if not np.isclose(stats[name], batch_stats[name])]
+        if diffs:
+            num_diffs += 1
+            print(f'  {diffs} differ for {config}')
+
+    return num_diffs
+
+def main(num_strats: int = 30) -> bool:
+    '''
+    Check the backtests agree on clean price data, and with missing values
+
+    Returns
+    -------
+    passed : bool
+        Whether every strategy gave the same statistics
+    '''
+    random.seed(0)
+    np.random.seed(0)
+
+    cases = {'clean': {},
+             'missing volume': {'Volume': [700]},
+             'missing close': {'Close': [900]},
+             'missing last row': {'Adj Close': [1499]},
+             }
+
+    passed = True
+    for case, missing in cases.items():
+        df = get_prices(1500, missing)
+
+        for strat_name in STRATS.keys():
+            num_diffs = check_strat(strat_name, df, num_strats)
+            status = 'ok' if num_diffs == 0 else f'FAIL ({num_diffs} differ)'
+            print(f'{case:<18} {strat_name:<22} {status}')
+            passed = passed and num_diffs == 0
+
+    return passed
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,140 @@
+'''
+A local stand-in for the AlphaVantage statement API, so the fundamentals
+downloader (utils/fund_download.py) can be checked offline.
+
+The server replies to the INCOME_STATEMENT, BALANCE_SHEET and CASH_FLOW
+functions with made-up annual and quarterly reports, and enforces a quota of
+calls per minute in the same way as the real API (a 'Note' is sent instead of
+the data). Unknown symbols get an 'Error Message', and the API key 'invalid'
+gets the 'Information' message the real API sends for a bad key. Run from the
+top folder of the repo with:
+
+    python -m utils.single_scripts.fake_alpha_vantage
+
+then set the 'base url' of the downloader to http://localhost:8502/query.
+'''
+
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+import urllib.parse
+
+# Other imports and type-hinting
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The fields in the reports of each statement, which are the fields used by
+# utils/fundamentals.py
+FIELDS = {'INCOME_STATEMENT': ['totalRevenue', 'costofGoodsAndServicesSold',
+                               'netIncome'],
+          'BALANCE_SHEET': ['totalAssets', 'totalCurrentAssets',
+                            'totalCurrentLiabilities', 'commonStock',
+                            'longTermDebt', 'inventory',
+                            'totalShareholderEquity', 'shortTermDebt'],
+          'CASH_FLOW': ['operatingCashflow', 'netIncome'],
+          }
+
+# The date offset between the reports of each period. Offset objects are
+# used rather than frequency strings, since the strings changed in pandas 2.2
+# ('A'/'Q' became 'YE'/'QE')
+OFFSETS = {'annual': pd.offsets.YearEnd(),
+           'quarterly': pd.offsets.QuarterEnd(),
+           }
+
+# Every call made to the server, used for the quota and to check the
+# downloader afterwards
+_fake = {'calls': [], 'lock': threading.Lock()}
+
+def get_reports(symbol: str,
+                function: str,
+                period: str) -> list:
+    '''
+    Make up the reports of a statement, the same symbol always gets the same
+    numbers
+    '''
+    rng = np.random.default_rng(sum(map(ord, symbol + function + period)))
+    dates = pd.date_range('2015-01-01', '2022-01-01', freq = OFFSETS[period])[::-1]
+
+    return [{'fiscalDateEnding': date.strftime('%Y-%m-%d'),
+             'reportedCurrency': 'USD',
+             **{field: str(round(rng.uniform(1e6, 1e8))) for field in FIELDS[function]},
+             } for date in dates]
+
+def start_server(port: int = 8502,
+                 calls_per_minute: int = 5,
+                 symbols: list = None) -> ThreadingHTTPServer:
+    '''
+    Start the server in a background thread
+
+    Parameters
+    ----------
+    port : int
+        The port to serve on
+    calls_per_minute : int
+        The quota of calls in any 60 second window
+    symbols : list
+        The symbols which have statements, defaults to every symbol
+
+    Returns
+    -------
+    server : ThreadingHTTPServer
+        The running server, call server.shutdown() to stop it
+    '''
+
+    class RequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+
+            with _fake['lock']:
+                now = time.monotonic()
+                recent = [t for t, _ in _fake['calls'] if now - t < 60]
+                limited = len(recent) >= calls_per_minute
+                _fake['calls'].append((now, query))
+
+            if query.get('apikey') == 'invalid':
+                reply = {'Information': 'the parameter apikey is invalid or '
+                                        'missing. Please claim your free API '
+                                        'key on https://www.alphavantage.co/'}
+            elif limited:
+                reply = {'Note': 'Thank you for using Alpha Vantage! Our '
+                                 f'standard API call frequency is {calls_per_minute} '
+                                 'calls per minute.'}
+            elif (query.get('function') not in FIELDS
+                  or (symbols is not None and query.get('symbol') not in symbols)):
+                reply = {'Error Message': 'Invalid API call.'}
+            else:
+                reply = {'symbol': query['symbol'],
+                         'annualReports': get_reports(query['symbol'],
+                                                      query['function'],
+                                                      'annual'),
+                         'quarterlyReports': get_reports(query['symbol'],
+                                                         query['function'],
+                                                         'quarterly'),
+                         }
+
+            data = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            return
+
+    server = ThreadingHTTPServer(('localhost', port), RequestHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+
+    return server
+
+if __name__ == '__main__':
+    server = start_server()
+    print('Serving the fake statements on http://localhost:8502/query')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
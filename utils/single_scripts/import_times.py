@@ -0,0 +1,113 @@
+'''
+Benchmark the time taken to import the project modules, and check that the
+heavy frameworks are not imported by modules which do not need them.
+
+Each module is imported in a fresh python process, so nothing is shared
+between the measurements. Run from the top folder of the repo with:
+
+    python -m utils.single_scripts.import_times
+
+The script exits with an error if any module imports a framework it should
+not, or takes longer than its time budget, so it can be used to catch import
+time regressions.
+'''
+
+import sys
+import json
+import subprocess
+
+# The modules to benchmark, along with the frameworks they must not import
+# and the maximum import time (in seconds) allowed
+MODULES = {
+    'nn.gen_input': {'banned': ['tensorflow', 'matplotlib', 'sklearn', 'yfinance'],
+                     'budget': 5.},
+    'nn.features': {'banned': ['tensorflow', 'matplotlib', 'sklearn'],
+                    'budget': 2.},
+    'nn.shards': {'banned': ['tensorflow', 'matplotlib', 'sklearn'],
+                  'budget': 2.},
+    'nn.pipeline': {'banned': ['tensorflow', 'matplotlib', 'sklearn'],
+                    'budget': 2.},
+    'nn.model': {'banned': ['tensorflow', 'matplotlib', 'sklearn'],
+                 'budget': 5.},
+    'nn.testing': {'banned': ['tensorflow', 'matplotlib', 'sklearn'],
+                   'budget': 5.},
+    'nn.service': {'banned': ['tensorflow', 'matplotlib', 'sklearn'],
+                   'budget': 5.},
+    'ga.funcs': {'banned': ['tensorflow', 'matplotlib', 'sklearn', 'yfinance'],
+                 'budget': 5.},
+    }
+
+# Run in the child process, prints the import time and the loaded frameworks
+CHILD_CODE = '''
+import sys, json, time, importlib
+start = time.perf_counter()
+importlib.import_module({module!r})
+print(json.dumps({{'time': time.perf_counter() - start,
+                  'loaded': [m for m in {banned!r} if m in sys.modules]}}))
+'''
+
+def time_import(module: str,
+                banned: list) -> dict:
+    '''
+    Import a module in a fresh python process
+
+    Parameters
+    ----------
+    module : str
+        The name of the module to import
+    banned : list
+        The frameworks to check for after the import
+
+    Returns
+    -------
+    result : dict
+        The 'time' (in seconds) taken to import the module, and which of the
+        banned frameworks were 'loaded'
+    '''
+    out = subprocess.run([sys.executable,
+                          '-c',
+                          CHILD_CODE.format(module = module, banned = banned),
+                          ],
+                         capture_output = True,
+                         text = True,
+                         )
+
+    if out.returncode != 0:
+        return {'time': float('nan'),
+                'loaded': [],
+                'error': out.stderr.strip().split('\n')[-1],
+                }
+
+    return json.loads(out.stdout.strip().split('\n')[-1])
+
+def main(modules: dict = MODULES) -> bool:
+    '''
+    Benchmark the import of each module, printing the results
+
+    Returns
+    -------
+    passed : bool
+        Whether every module imported within its budget, without importing
+        any of its banned frameworks
+    '''
+    passed = True
+
+    for module, checks in modules.items():
+        result = time_import(module, checks['banned'])
+
+        if 'error' in result:
+            status = f'ERROR ({result["error"]})'
+        elif result['loaded']:
+            status = f'FAIL (imported {", ".join(result["loaded"])})'
+        elif result['time'] > checks['budget']:
+            status = f'FAIL (budget {checks["budget"]:.1f}s)'
+        else:
+            status = 'ok'
+
+        passed = passed and status == 'ok'
+        print(f'{module:<16} {result["time"]:7.3f}s  {status}')
+
+    return passed
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
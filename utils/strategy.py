@@ -11,6 +11,15 @@ from typing import Tuple
 from numpy import array as np_arr
 from pandas import DataFrame as pandasDF
 
+# The statistics produced for each strategy, in the column order used by the
+# batched backtest
+STAT_NAMES = ['win rate', 'avg profit', 'std profit', 'median profit',
+              'mean hold', 'median hold', 'min hold', 'max hold',
+              'number of trades']
+
+# The column used by the batched backtest to track the rows of the price data
+ROW_COL = 'row number'
+
 
 def add_strat_cols(df: pandasDF,
                    config: dict,
@@ -54,7 +63,8 @@ def get_buy_signals(df: pandasDF,
     
 def run_strategy(df: pandasDF,
                  config: dict,
-                 strat_name: str) -> Tuple[pandasDF, dict]:
+                 strat_name: str,
+                 stats_only: bool = False) -> Tuple[pandasDF, dict]:
     '''
     Run the strategy on the current ticker and with the specified config
 
@@ -66,45 +76,94 @@ def run_strategy(df: pandasDF,
         The configuration settings for the strategy
     strat_name : str
         The name of the strategy we are considering
+    stats_only : bool
+        Only calculate the statistics, in a single compiled pass over the
+        trades, without building the summary of each trade
 
     Returns
     -------
     df_summary : pandasDF
-        The dates of each trade, along with the profit and trade-days held
+        The dates of each trade, along with the profit and trade-days held.
+        None if stats_only is set.
     stats: dict
         The key metrics to judge the strategy by 
     '''
     
     # Get the indexes of the buy signals
     signal_idx = get_buy_signals(df, strat_name, config)
+    
+    if stats_only:
+        stats = make_trades_stats(df['Open'].values.astype(np.float64),
+                                  df['Low'].values.astype(np.float64),
+                                  df['High'].values.astype(np.float64),
+                                  signal_idx.astype(np.int64),
+                                  float(config['profit']),
+                                  float(config['stop']),
+                                  int(config['max hold']),
+                                  )
+        return None, stats_to_dict(stats)
 
     # Perform the buying and selling
-    percs, bought, sold = make_trades(df['Open'].values.astype(np.float64),
-                                      df['Low'].values.astype(np.float64),
-                                      df['High'].values.astype(np.float64),
-                                      signal_idx.astype(np.int64),
-                                      config['profit'],
-                                      config['stop'],
-                                      config['max hold'],
-                                      )
+    percs, bought, sold = get_trade_arrays(df, config, strat_name, signal_idx)
     
     # Calculate the hold time metric
-    hold = np.array(sold) - np.array(bought)
+    hold = sold - bought
     
     # Get the summaries and return the results
     df_summary = summarise_buy_sell(df, percs, bought, sold, hold)
-    stats = get_strat_stats(np.array(percs), hold)
+    stats = get_strat_stats(percs, hold)
     
     return df_summary, stats
     
-@nb.jit(nopython = True)
+def get_trade_arrays(df: pandasDF,
+                     config: dict,
+                     strat_name: str,
+                     signal_idx: np_arr = None) -> Tuple[np_arr, np_arr, np_arr]:
+    '''
+    Run the buying and selling for the strategy, and return the trades made
+
+    Parameters
+    ----------
+    df : pandasDF
+        The price data
+    config : dict
+        The configuration settings for the strategy
+    strat_name : str
+        The name of the strategy we are considering
+    signal_idx : np_arr
+        The indexes of the buy signals, found from the strategy if not given
+
+    Returns
+    -------
+    percs : np_arr
+        Percentage profit/loss from each trade
+    bought, sold : np_arr
+        The row indexes in the price data at which the stock was bought and
+        sold
+    '''
+    if signal_idx is None:
+        signal_idx = get_buy_signals(df, strat_name, config)
+    
+    percs, bought, sold, count = make_trades(df['Open'].values.astype(np.float64),
+                                             df['Low'].values.astype(np.float64),
+                                             df['High'].values.astype(np.float64),
+                                             signal_idx.astype(np.int64),
+                                             float(config['profit']),
+                                             float(config['stop']),
+                                             int(config['max hold']),
+                                             )
+    
+    # Only the first count entries of the arrays hold completed trades
+    return percs[:count], bought[:count], sold[:count]
+    
+@nb.jit(nopython = True, cache = True)
 def make_trades(Open: np_arr,
                 Low: np_arr,
                 High: np_arr,
                 signal_idx: np_arr,
                 profit: float,
                 stop: float,
-                max_hold: float) -> Tuple[list, list, list]:
+                max_hold: int) -> Tuple[np_arr, np_arr, np_arr, int]:
     '''
     Run the boll band. The rules are simple, buy on the next open if the stock
     closes below the lower band, and wait until the profit target/stop loss/
@@ -118,16 +177,18 @@ def make_trades(Open: np_arr,
         The indexes where a buy signal was noticed on the close
     profit, stop : float
         The profit target and stop loss (in percentages)
-    max_hold : float
+    max_hold : int
         The maximum number of days to hold the stock for
 
     Returns
     -------
-    percs : list
+    percs : np_arr
         Percentage profit/loss from each trade
-    bought, sold : list
-        The indexes in the dataframe at which the 
-        DESCRIPTION.
+    bought, sold : np_arr
+        The indexes in the dataframe at which the stock was bought and sold
+    count : int
+        The number of trades made. The arrays are sized for one trade per
+        signal, only the first count entries are filled.
         
     Notes
     -----
@@ -136,58 +197,301 @@ def make_trades(Open: np_arr,
     pretty quick).
     '''
     
-    # Initialise lists to store the data
-    percs = []
-    bought = []
-    sold = []
+    # Each signal makes at most one trade, so preallocate for every signal
+    percs = np.empty(signal_idx.shape[0], dtype = np.float64)
+    bought = np.empty(signal_idx.shape[0], dtype = np.int64)
+    sold = np.empty(signal_idx.shape[0], dtype = np.int64)
+    count = 0
     
     for signal in signal_idx:
         
-        price = Open[signal + 1]
+        # Avoiding penny-stock behaviours. Only trades with enough data after
+        # the signal to be completed are made.
+        if Open[signal + 1] > 1 and signal + max_hold + 1 < Open.shape[0]:
+            perc, idx = sell_trade(Open, Low, High, signal, profit, stop, max_hold)
+            percs[count] = perc
+            bought[count] = signal + 1
+            sold[count] = idx
+            count += 1
+        
+    return percs, bought, sold, count
+
+@nb.jit(nopython = True, cache = True)
+def sell_trade(Open: np_arr,
+               Low: np_arr,
+               High: np_arr,
+               signal: int,
+               profit: float,
+               stop: float,
+               max_hold: int) -> Tuple[float, int]:
+    '''
+    Follow a trade bought on the open after the signal, until the profit
+    target/stop loss/max days are hit. The caller must check there are enough
+    days of data after the signal.
+
+    Returns
+    -------
+    perc : float
+        Percentage profit/loss from the trade
+    idx : int
+        The index in the price data at which the stock was sold
+    '''
+    price = Open[signal + 1]
+    
+    for day in range(1, max_hold + 2):
+        idx = signal + day
+        
+        if 100*(High[idx]/price - 1) >= profit:
+            return profit, idx
+            
+        elif 100*(Low[idx]/price - 1) <= stop:
+            return stop, idx
+    
+    # Neither were hit, so sell on the open of the final day
+    idx = signal + max_hold + 1
+    return 100*(Open[idx]/price - 1), idx
+
+@nb.jit(nopython = True, cache = True, parallel = True)
+def make_trades_batch(Open: np_arr,
+                      Low: np_arr,
+                      High: np_arr,
+                      signal_idx: np_arr,
+                      signal_offsets: np_arr,
+                      profit: np_arr,
+                      stop: np_arr,
+                      max_hold: np_arr) -> np_arr:
+    '''
+    Run the buying and selling for a whole population of strategies on one
+    ticker, and calculate the statistics of each strategy in the same pass.
+    The strategies are run in parallel.
+
+    Parameters
+    ----------
+    Open, Low, High: np_arr
+        The open/low/high stock-prices
+    signal_idx: np_arr
+        The buy signal indexes of every strategy, one after the other
+    signal_offsets: np_arr
+        The signals of strategy k are signal_idx[signal_offsets[k]:
+        signal_offsets[k+1]]
+    profit, stop : np_arr
+        The profit target and stop loss (in percentages) of each strategy
+    max_hold : np_arr
+        The maximum number of days to hold the stock for, for each strategy
+
+    Returns
+    -------
+    stats : np_arr
+        The statistics of each strategy, with the columns in STAT_NAMES order
+    '''
+    num_strats = signal_offsets.shape[0] - 1
+    stats = np.zeros((num_strats, 9))
+    
+    # Preallocate the trade results for every strategy. Each strategy makes at
+    # most one trade per signal, so it can use its own slice of the signals
+    percs = np.empty(signal_idx.shape[0])
+    hold = np.empty(signal_idx.shape[0])
+    
+    for k in nb.prange(num_strats):
+        start = signal_offsets[k]
+        stop_n = signal_offsets[k+1]
+        
+        count = fill_trades(Open, Low, High,
+                            signal_idx[start:stop_n],
+                            profit[k], stop[k], max_hold[k],
+                            percs[start:stop_n],
+                            hold[start:stop_n],
+                            )
+        
+        fill_stats(percs[start:start + count],
+                   hold[start:start + count],
+                   stats[k],
+                   )
+        
+    return stats
+
+@nb.jit(nopython = True, cache = True)
+def make_trades_stats(Open: np_arr,
+                      Low: np_arr,
+                      High: np_arr,
+                      signal_idx: np_arr,
+                      profit: float,
+                      stop: float,
+                      max_hold: int) -> np_arr:
+    '''
+    Run the buying and selling for a single strategy, and calculate its
+    statistics (in STAT_NAMES order) in the same compiled call. See
+    make_trades for the parameters.
+    '''
+    percs = np.empty(signal_idx.shape[0])
+    hold = np.empty(signal_idx.shape[0])
+    stats = np.zeros(9)
+    
+    count = fill_trades(Open, Low, High, signal_idx, profit, stop, max_hold,
+                        percs, hold)
+    fill_stats(percs[:count], hold[:count], stats)
+    
+    return stats
+
+@nb.jit(nopython = True, cache = True)
+def fill_trades(Open: np_arr,
+                Low: np_arr,
+                High: np_arr,
+                signal_idx: np_arr,
+                profit: float,
+                stop: float,
+                max_hold: int,
+                percs: np_arr,
+                hold: np_arr) -> int:
+    '''
+    Make the trades for each buy signal, filling the profit/loss and holding
+    time of each completed trade into the start of percs and hold (which must
+    be at least as long as signal_idx).
+
+    Returns
+    -------
+    count : int
+        The number of trades made
+    '''
+    count = 0
+    
+    for signal in signal_idx:
         
         # Avoiding penny-stock behaviours
-        if price > 1 and signal + max_hold + 1 < Open.shape[0]:
-            bought.append(signal + 1)
+        if Open[signal + 1] > 1 and signal + max_hold + 1 < Open.shape[0]:
+            perc, idx = sell_trade(Open, Low, High, signal, profit, stop, max_hold)
+            percs[count] = perc
+            hold[count] = idx - signal - 1
+            count += 1
             
-            for day in range(1, max_hold + 2):
-                idx = signal + day
-                
-                if 100*(High[idx]/price - 1) >= profit:
-                    percs.append(profit)
-                    sold.append(idx)
-                    break
-                    
-                elif 100*(Low[idx]/price - 1) <= stop:
-                    percs.append(stop)
-                    sold.append(idx)
-                    break
-                
-                elif day == max_hold + 1:
-                    percs.append(100*(Open[idx]/price - 1))
-                    sold.append(idx)
-                
-    # After the buying and selling has terminated, eliminate any final buy
-    # signals. We are only interested in completed trades
-    if len(bought) > len(percs):
-        del bought[-1]
+    return count
+
+@nb.jit(nopython = True, cache = True)
+def fill_stats(percs: np_arr,
+               hold: np_arr,
+               out: np_arr):
+    '''
+    Fill a row of strategy statistics (in STAT_NAMES order) from the trades,
+    the same statistics as get_strat_stats. The row is left as zeros if no
+    trades were made.
+    '''
+    n = percs.shape[0]
+    if n == 0:
+        return
+    
+    out[0] = 100*np.sum(percs > 0)/n
+    out[1] = np.mean(percs)
+    out[2] = np.std(percs)
+    out[3] = np.median(percs)
+    out[4] = np.mean(hold)
+    out[5] = np.median(hold)
+    out[6] = np.min(hold)
+    out[7] = np.max(hold)
+    out[8] = n
+    
+def run_strategy_batch(df: pandasDF,
+                       configs: list,
+                       strat_name: str) -> list:
+    '''
+    Run a population of strategies on the same ticker, with one compiled call
+    for the buying/selling and statistics of every strategy.
+
+    Parameters
+    ----------
+    df : pandasDF
+        The price data
+    configs : list
+        The configuration settings for each strategy
+    strat_name : str
+        The name of the strategy we are considering
+
+    Returns
+    -------
+    stats : list
+        The key metrics for each strategy, in the same order as configs
+    '''
+    
+    # Number the rows, so the rows of the price data kept by each strategy
+    # can be found after the strategy columns are added
+    df[ROW_COL] = np.arange(df.shape[0])
+    
+    signals = []
+    batched = []
+    stats = np.zeros((len(configs), len(STAT_NAMES)))
+    
+    for n, config in enumerate(configs):
+        
+        # The strategy columns are overwritten for each strategy, so the same
+        # dataframe can be reused
+        df_strat = add_strat_cols(df, config, strat_name)
+        signal_idx = get_buy_signals(df_strat, strat_name, config)
+        rows = df_strat[ROW_COL].values
         
-    return percs, bought, sold
+        # Usually only the rows at the start are dropped (where the moving
+        # averages are not yet defined), so the signals can be shifted back
+        # to the full price data and batched. If any other rows were dropped
+        # (e.g. a missing price), the trades are made on the remaining rows,
+        # as in run_strategy.
+        if rows.shape[0] > 0 and rows[0] + rows.shape[0] == df.shape[0]:
+            signals.append(signal_idx + rows[0])
+            batched.append(n)
+        else:
+            stats[n] = make_trades_stats(df_strat['Open'].values.astype(np.float64),
+                                         df_strat['Low'].values.astype(np.float64),
+                                         df_strat['High'].values.astype(np.float64),
+                                         signal_idx.astype(np.int64),
+                                         float(config['profit']),
+                                         float(config['stop']),
+                                         int(config['max hold']),
+                                         )
+    
+    df.drop(columns = ROW_COL, inplace = True)
+    
+    if len(batched) == 0:
+        return [stats_to_dict(row) for row in stats]
+    
+    configs = [configs[n] for n in batched]
+    signal_offsets = np.zeros(len(configs) + 1, dtype = np.int64)
+    signal_offsets[1:] = np.cumsum([s.shape[0] for s in signals])
+    
+    stats[batched] = make_trades_batch(df['Open'].values.astype(np.float64),
+                                       df['Low'].values.astype(np.float64),
+                                       df['High'].values.astype(np.float64),
+                                       np.concatenate(signals).astype(np.int64),
+                                       signal_offsets,
+                                       np.array([c['profit'] for c in configs], dtype = np.float64),
+                                       np.array([c['stop'] for c in configs], dtype = np.float64),
+                                       np.array([c['max hold'] for c in configs], dtype = np.int64),
+                                       )
+    
+    return [stats_to_dict(row) for row in stats]
+
+def stats_to_dict(stats: np_arr) -> dict:
+    '''
+    Convert a row of statistics (in STAT_NAMES order) from the compiled
+    backtests into the same dictionary as get_strat_stats
+    '''
+    stats = dict(zip(STAT_NAMES, stats.tolist()))
+    for name in ['min hold', 'max hold', 'number of trades']:
+        stats[name] = int(stats[name])
+    
+    return stats
     
 def summarise_buy_sell(df: pandasDF,
-                       percs: list,
-                       bought: list,
-                       sold: list,
+                       percs: np_arr,
+                       bought: np_arr,
+                       sold: np_arr,
                        hold: np_arr) -> pandasDF:
     '''
     Parameters
     ----------
     df : pandasDF
         Price data
-    percs : list
+    percs : np_arr
         Profit/losses from the trades made
-    bought : list
+    bought : np_arr
         Indexes of the dates where the stock was bought
-    sold : list
+    sold : np_arr
         Indexes of the dates where the stock was sold
     hold: np_arr
         The holding time for the stock
@@ -2,9 +2,13 @@
 Functionality to get ticker names and data
 '''
 import os
+import shutil
 import random
+import numpy as np
 import pandas as pd
-import yfinance as yf
+
+# Project imports
+from utils import price_store
 
 def get_random_tickers(n: int) -> list:
     '''
@@ -27,8 +31,9 @@ def get_all_ticker_names():
     Get a list of all ticker names in the data-directory.
     '''
     # To remove duplicated entries since fundamentals exist in this folder too,
-    # the list is turned into a set and back to a list again
-    return list(
+    # the list is turned into a set and back to a sorted list again (sorting
+    # keeps the random selections reproducible for a given seed)
+    return sorted(
         set([s.split('.csv')[0].split('_')[0]
              for s in os.listdir('data/') if '.csv' in s]
             )
@@ -108,7 +113,10 @@ def spy_tickers() -> list:
     
     return df[0]['Symbol'].tolist()
 
-def get_data(tickers: list):
+def get_data(tickers: list,
+             incremental: bool = False,
+             batch_size: int = 100,
+             fetcher = None):
     '''
     Obtain historical daily price data for all tickers specified. The outcome
     is a csv file of price data for each ticker in the data folder.
@@ -117,14 +125,120 @@ def get_data(tickers: list):
     ----------
     tickers : list
         A list of the tickers to download the data for
+    incremental : bool
+        Whether to only download the days after the last stored date of each
+        ticker and append them to its csv file, rather than downloading and
+        rewriting the full history. Tickers without a csv file, or whose
+        history has been adjusted since it was stored, are downloaded in full.
+    batch_size : int
+        The number of tickers downloaded at a time
+    fetcher : callable
+        The source of the price data, called as fetcher(tickers, start) where
+        start is the first 'YYYY-MM-DD' date wanted (None for the full
+        history). It returns a dict of ticker -> dataframe with a 'Date'
+        column and the price columns, leaving out any ticker which failed.
+        Defaults to yahoo finance (yahoo_fetcher).
 
     Returns
     -------
     None
     '''
+    if fetcher is None:
+        fetcher = yahoo_fetcher
+    
+    for start in range(0, len(tickers), batch_size):
+        batch = tickers[start:start + batch_size]
+        print(f'Downloading tickers {start + 1}-{start + len(batch)} of '
+              f'{len(tickers)}')
+        
+        if incremental:
+            update_batch(batch, fetcher)
+            continue
+        
+        data = fetcher(batch, None)
+        for ticker in batch:
+            if ticker in data and data[ticker].shape[0] > 0:
+                write_prices(ticker, data[ticker])
+            else:
+                print(f'Ticker {ticker} failed to download.')
+
+def update_batch(tickers: list,
+                 fetcher):
+    '''
+    Download only the days since the last stored date of each ticker, and
+    append them to the csv files. The batch is downloaded with one call,
+    starting from the earliest last date in the batch.
+
+    The last stored day is downloaded again and compared with the stored
+    row. Yahoo adjusts the whole price history after a split (and the Adj
+    Close after a dividend), in which case the stored rows no longer match
+    and the ticker is downloaded again in full rather than appended to.
+    '''
+    last_rows = {ticker: get_last_row(ticker) for ticker in tickers}
+    
+    stored = [ticker for ticker in tickers if last_rows[ticker] is not None]
+    full = [ticker for ticker in tickers if last_rows[ticker] is None]
+    
+    if stored:
+        start = min([last_rows[ticker]['Date'] for ticker in stored])
+        data = fetcher(stored, start)
+        
+        for ticker in stored:
+            if ticker not in data:
+                print(f'Ticker {ticker} failed to download.')
+                continue
+            
+            df = format_dates(data[ticker])
+            last_row = last_rows[ticker]
+            
+            if not is_same_row(df[df['Date'] == last_row['Date']], last_row):
+                print(f'Ticker {ticker} has been adjusted since the last '
+                      'download, downloading the full history.')
+                full.append(ticker)
+                continue
+            
+            df = df[df['Date'] > last_row['Date']]
+            if df.shape[0] > 0:
+                append_prices(ticker, df)
+    
+    if full:
+        data = fetcher(full, None)
+        for ticker in full:
+            if ticker in data and data[ticker].shape[0] > 0:
+                write_prices(ticker, data[ticker])
+            else:
+                print(f'Ticker {ticker} failed to download.')
+
+def is_same_row(df: pd.DataFrame,
+                last_row: dict) -> bool:
+    '''
+    Check if the downloaded data (filtered to the last stored date) matches
+    the last stored row. The volume is not compared, since it is often
+    revised after the day.
+    '''
+    if df.shape[0] != 1:
+        return False
+    
+    cols = [col for col in last_row.keys() if col not in ['Date', 'Volume']]
+    if not set(cols).issubset(df.columns):
+        return False
+    
+    stored = np.array([float(last_row[col]) for col in cols])
+    fetched = df[cols].to_numpy(dtype = np.float64)[0]
+    
+    return bool(np.allclose(fetched, stored, rtol = 1e-6, atol = 0.))
+
+def yahoo_fetcher(tickers: list,
+                  start: str = None) -> dict:
+    '''
+    Download the daily price data of the tickers from yahoo finance, see
+    get_data for the parameters and returns
+    '''
+    
+    import yfinance as yf
     
-    print('Downloading the data from yahoo finance')
     data = yf.download(tickers = tickers,
+                       start = start,
                        interval = '1D',
                        group_by = 'ticker',
                        auto_adjust = False,
@@ -133,14 +247,97 @@ def get_data(tickers: list):
                        proxy = None
                        )
     
-    data = data.T
+    frames = {}
+    
+    # Some versions of yfinance only group the columns by ticker when more
+    # than one ticker is downloaded
+    if not isinstance(data.columns, pd.MultiIndex):
+        if len(tickers) == 1 and data.shape[0] > 0:
+            frames[tickers[0]] = data.reset_index().dropna()
+        return frames
     
-    print('Data downloaded. Saving the csv files in the data directory.')
+    downloaded = data.columns.get_level_values(0)
     for ticker in tickers:
         
-        # Try statement is required because sometimes a ticker fails to download
-        try:
-            df = data.loc[(ticker.upper(),),].T.reset_index().dropna()
-            df.to_csv(f'data/{ticker}.csv', index = False)
-        except:
-            print(f'Ticker {ticker} failed to download.')
\ No newline at end of file
+        # Sometimes a ticker fails to download, and is missing from the data
+        if ticker.upper() in downloaded:
+            frames[ticker] = data[ticker.upper()].reset_index().dropna()
+    
+    return frames
+
+def format_dates(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Convert the dates of downloaded price data into 'YYYY-MM-DD' strings, the
+    format of the stored csv files
+    '''
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
+    return df
+
+def get_last_row(ticker: str) -> dict:
+    '''
+    Get the last row in the csv file of a ticker (as strings, keyed by the
+    column names), by reading only the start and end of the file. None is
+    returned if there is no csv file or it has no rows.
+    '''
+    path = price_store.get_csv_path(ticker)
+    if not os.path.isfile(path):
+        return None
+    
+    with open(path, 'rb') as f:
+        columns = f.readline().decode().strip().split(',')
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    
+    values = lines[-1].decode().split(',') if lines else columns
+    if values == columns or len(values) != len(columns):
+        return None
+    
+    last_row = dict(zip(columns, values))
+    last_row['Date'] = last_row['Date'][:10]
+    
+    return last_row
+
+def write_prices(ticker: str,
+                 df: pd.DataFrame):
+    '''
+    Write the full price history of a ticker to its csv file, replacing any
+    existing file
+    '''
+    path = price_store.get_csv_path(ticker)
+    
+    # Write to a temporary file first, so a partially written file is never
+    # left in place of the data
+    format_dates(df).to_csv(path + '.tmp', index = False)
+    os.replace(path + '.tmp', path)
+
+def append_prices(ticker: str,
+                  df: pd.DataFrame):
+    '''
+    Append new days of price data to the csv file of a ticker. The new rows
+    are appended to a copy of the file, which then replaces the original, so
+    the file is either fully updated or left as it was.
+    '''
+    path = price_store.get_csv_path(ticker)
+    
+    with open(path) as f:
+        columns = f.readline().strip().split(',')
+    
+    if set(columns) != set(df.columns):
+        print(f'Ticker {ticker} has different price columns to the stored '
+              'data, skipping the update.')
+        return
+    
+    shutil.copyfile(path, path + '.tmp')
+    
+    with open(path + '.tmp', 'rb+') as f:
+        # Make sure the new rows start on a new line
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b'\n':
+            f.write(b'\n')
+    
+    with open(path + '.tmp', 'a', newline = '') as f:
+        df[columns].to_csv(f, header = False, index = False)
+    
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,134 @@
+'''
+Functionality for compiling the numba kernels ahead of the real work.
+
+All of the kernels are compiled with cache = True, so the machine code is
+written to disk (in __pycache__) the first time a signature is compiled and
+loaded by every later process. Warming up calls each kernel on a tiny set of
+inputs, with the same dtypes used by the strategies, so the compilation (or
+loading from the disk cache) happens up-front rather than on the first ticker.
+The warmup only covers writable, C-contiguous float64 arrays, so the callers
+copy any price data (e.g. read-only views of the panel) before calling a
+kernel.
+The warmup can be run once after downloading data with:
+
+    python -m utils.warmup
+'''
+
+import time
+import numpy as np
+
+# Project imports
+from utils import strategy, indicators
+
+def get_warmup_inputs() -> dict:
+    '''
+    Small inputs with the same dtypes as the price data used by the kernels
+    '''
+    n = 50
+    Open = np.linspace(10., 20., n)
+
+    return {'Open': Open,
+            'Low': Open*0.98,
+            'High': Open*1.02,
+            'signal idx': np.array([1, 10, 20], dtype = np.int64),
+            'signal offsets': np.array([0, 2, 3], dtype = np.int64),
+            'profit': 5.,
+            'stop': -5.,
+            'max hold': 5,
+            }
+
+def get_kernels(include_nn: bool = False) -> dict:
+    '''
+    Get each kernel to compile, as a function calling it on the warmup inputs
+
+    Parameters
+    ----------
+    include_nn : bool
+        Whether to include the nn kernels, which requires importing the nn
+        input generation code
+
+    Returns
+    -------
+    kernels : dict
+        The name of each kernel, and a function to run it
+    '''
+    x = get_warmup_inputs()
+
+    kernels = {
+        'make_trades': lambda: strategy.make_trades(x['Open'], x['Low'], x['High'],
+                                                    x['signal idx'],
+                                                    x['profit'], x['stop'],
+                                                    x['max hold'],
+                                                    ),
+        'make_trades_stats': lambda: strategy.make_trades_stats(x['Open'], x['Low'],
+                                                                x['High'],
+                                                                x['signal idx'],
+                                                                x['profit'],
+                                                                x['stop'],
+                                                                x['max hold'],
+                                                                ),
+        'make_trades_batch': lambda: strategy.make_trades_batch(x['Open'], x['Low'],
+                                                                x['High'],
+                                                                x['signal idx'],
+                                                                x['signal offsets'],
+                                                                np.array([5., 3.]),
+                                                                np.array([-5., -3.]),
+                                                                np.array([5, 3], dtype = np.int64),
+                                                                ),
+        'rolling_mean_std': lambda: indicators.rolling_mean_std(x['Open'], 5),
+        'rolling_matrix_kernel': lambda: indicators.rolling_matrix_kernel(x['Open'], 3, 5),
+        }
+
+    if include_nn:
+        from nn import gen_input
+        kernels['labeller'] = lambda: gen_input.labeller(x['Open'] - 15.,
+                                                         x['profit'],
+                                                         x['stop'],
+                                                         )
+
+    return kernels
+
+def compile_kernels(include_nn: bool = False,
+                    verbose: bool = True) -> dict:
+    '''
+    Compile (or load from the disk cache) each numba kernel, and time the
+    compile and run times separately
+
+    Parameters
+    ----------
+    include_nn : bool
+        Whether to include the nn kernels
+    verbose : bool
+        Whether to print the timings
+
+    Returns
+    -------
+    timings : dict
+        The compile time and run time (in seconds) of each kernel
+    '''
+    timings = {}
+
+    for name, kernel in get_kernels(include_nn).items():
+
+        # The first call compiles the kernel (or loads it from the cache),
+        # the second call is only the run time
+        start = time.perf_counter()
+        kernel()
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        kernel()
+        run = time.perf_counter() - start
+
+        timings[name] = {'compile': max(first - run, 0.), 'run': run}
+
+    if verbose:
+        for name, t in timings.items():
+            print(f'{name}: compile {t["compile"]:.3f}s, run {t["run"]*1e3:.3f}ms')
+        print('Total compile time: '
+              f'{sum([t["compile"] for t in timings.values()]):.2f}s')
+
+    return timings
+
+if __name__ == '__main__':
+    compile_kernels(include_nn = True)
@@ -0,0 +1,67 @@
+'''
+Functionality for running work in parallel in a pool of worker processes.
+
+Each worker limits the threads of the parallel numba kernels to its share of
+the cores, so the workers do not oversubscribe the machine. It then compiles
+(or loads) the numba kernels and sets up its own state, e.g. opening the
+memory-mapped price panel, so nothing large has to be pickled and sent with
+every task. The task functions run in the workers read this state from
+workers.state.
+'''
+
+import os
+import multiprocessing
+import numba as nb
+
+# Project imports
+from utils import warmup
+
+# Other imports and type-hinting
+from typing import Callable
+from concurrent.futures import ProcessPoolExecutor
+
+# The state of a worker process, set by init_worker
+state = {}
+
+def get_pool(num_workers: int,
+             setup: Callable,
+             *args) -> ProcessPoolExecutor:
+    '''
+    Start the worker processes, or return None if only a single worker is
+    wanted
+
+    Parameters
+    ----------
+    num_workers : int
+        The number of worker processes
+    setup : Callable
+        Called with args in each worker, returning a dict of the state the
+        tasks need. It must be a module level function, so it can be sent to
+        the workers.
+
+    Returns
+    -------
+    pool : ProcessPoolExecutor
+        The pool of workers, or None
+    '''
+    if num_workers <= 1:
+        return None
+
+    # The workers are spawned rather than forked, since forking after the
+    # parallel numba kernels have started their threads can deadlock
+    return ProcessPoolExecutor(max_workers = num_workers,
+                               mp_context = multiprocessing.get_context('spawn'),
+                               initializer = init_worker,
+                               initargs = (num_workers, setup, args),
+                               )
+
+def init_worker(num_workers: int,
+                setup: Callable,
+                args: tuple):
+    '''
+    Initialise a worker process, compiling the kernels and setting its state
+    '''
+    nb.set_num_threads(max(1, min(nb.config.NUMBA_NUM_THREADS,
+                                  (os.cpu_count() or 1)//num_workers)))
+    warmup.compile_kernels(verbose = False)
+    state.update(setup(*args))